@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import bulk
+from server_srav import Server_Srav
+from storage import SQLiteStore
+
+PER_CALL_SAMPLE = 10_000
+
+
+def write_ndjson(path, n_devices):
+    with open(path, 'w') as f:
+        for i in range(n_devices):
+            f.write(json.dumps({'user_id': f"user{i}", 'public_ver_key': str(i + 2)}) + '\n')
+
+
+def bench_register_device(tmp, n_devices):
+    server = Server_Srav(os.path.join(tmp, "per_call.db"))
+    start = time.perf_counter()
+    for i in range(n_devices):
+        server.register_device(f"user{i}", i + 2, suppress_output=True)
+    elapsed = time.perf_counter() - start
+    server.close()
+    return n_devices / elapsed
+
+
+def bench_bulk(tmp, n_devices, chunk_size):
+    source = os.path.join(tmp, "devices.ndjson")
+    write_ndjson(source, n_devices)
+    store = SQLiteStore(os.path.join(tmp, "bulk.db"))
+    start = time.perf_counter()
+    with open(source) as f:
+        stats = bulk.import_devices(store, bulk.read_records(f), chunk_size)
+    imported = time.perf_counter() - start
+    assert stats['imported'] == n_devices
+
+    start = time.perf_counter()
+    with open(os.path.join(tmp, "export.ndjson"), 'w') as f:
+        bulk.export_devices(store, f, page_size=chunk_size)
+    exported = time.perf_counter() - start
+    store.close()
+    return n_devices / imported, n_devices / exported
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    with tempfile.TemporaryDirectory() as tmp:
+        rate = bench_register_device(tmp, PER_CALL_SAMPLE)
+        print(f"register_device x{PER_CALL_SAMPLE}: {rate:>10.0f} rows/s")
+    for n in sizes:
+        for chunk_size in (10_000, 50_000):
+            with tempfile.TemporaryDirectory() as tmp:
+                import_rate, export_rate = bench_bulk(tmp, n, chunk_size)
+            print(f"{n:>9} rows, chunk {chunk_size:>6}: import {import_rate:>10.0f} rows/s, "
+                  f"export {export_rate:>10.0f} rows/s")
@@ -0,0 +1,38 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import logs
+from server_srav import Server_Srav
+
+LOGINS = 3000
+KEY = 11
+
+
+def run(tmp, level, mode):
+    # challenge -> verify -> validate per login; returns microseconds per login.
+    server = Server_Srav(os.path.join(tmp, f"{mode}-{level}.db"), lazy=True)
+    server.register_device("alice", KEY, suppress_output=True)
+    with open(os.path.join(tmp, f"{mode}-{level}.log"), 'w') as stream:
+        close = logs.configure(level, stream, mode)
+        start = time.perf_counter()
+        for _ in range(LOGINS):
+            challenge = server.generate_challenge("alice")
+            _, token = server.verify_zkp_proof("alice", challenge, pow(challenge, KEY, server.P))
+            server.validate_session("alice", token)
+        elapsed = time.perf_counter() - start
+        close()  # async and buffered records are written here, outside the timing
+    server.close()
+    return elapsed / LOGINS * 1e6
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        quiet = run(tmp, logging.WARNING, 'direct')
+        print(f"quiet (WARNING)        {quiet:8.1f} us/login")
+        for mode in logs.MODES:
+            verbose = run(tmp, logging.DEBUG, mode)
+            print(f"verbose DEBUG {mode:<8} {verbose:8.1f} us/login  (+{verbose - quiet:.1f} us)")
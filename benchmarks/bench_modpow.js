@@ -0,0 +1,47 @@
+// Headless benchmark of the web client's proof computation (challenge^x mod P).
+//
+//     node benchmarks/bench_modpow.js [rounds]
+//
+// Compares the square-and-multiply modPow script.js used to run on the main
+// thread with zkp_math.powModP, with and without the key's window recoding
+// precomputed (as zkp_worker.js does once the key is loaded).
+const crypto = require('crypto');
+const path = require('path');
+const { P, recode, powModP, generateMasterKey } = require(path.join(__dirname, '..', 'src', 'static', 'zkp_math.js'));
+
+// The previous implementation, verbatim.
+function modPow(base, exponent, modulus) {
+    if (modulus === 1n) return 0n;
+    let result = 1n;
+    base = base % modulus;
+    while (exponent > 0n) {
+        if (exponent % 2n === 1n) result = (result * base) % modulus;
+        exponent = exponent >> 1n;
+        base = (base * base) % modulus;
+    }
+    return result;
+}
+
+function run(name, rounds, inputs, fn) {
+    for (let i = 0; i < 20; i++) fn(...inputs[i % inputs.length]);  // warm up the JIT
+    const start = process.hrtime.bigint();
+    for (let i = 0; i < rounds; i++) fn(...inputs[i % inputs.length]);
+    const ms = Number(process.hrtime.bigint() - start) / 1e6 / rounds;
+    console.log(`${name.padEnd(36)} ${ms.toFixed(3).padStart(8)} ms/op  ${(1000 / ms).toFixed(0).padStart(7)} ops/s`);
+    return ms;
+}
+
+const rounds = Number(process.argv[2] || 2000);
+const randomBytes = n => new Uint8Array(crypto.randomBytes(n));
+const key = generateMasterKey(randomBytes);
+const plan = recode(key);
+const inputs = Array.from({ length: 64 }, () => [generateMasterKey(randomBytes)]);
+for (const [challenge] of inputs) {
+    if (powModP(challenge, plan) !== modPow(challenge, key, P)) throw new Error('powModP disagrees with modPow');
+}
+
+const baseline = run('modPow (square-and-multiply, %)', rounds, inputs, c => modPow(c, key, P));
+const windowed = run('powModP', rounds, inputs, c => powModP(c, key));
+const precomputed = run('powModP, key recoded ahead', rounds, inputs, c => powModP(c, plan));
+run('generateMasterKey', rounds, inputs, () => generateMasterKey(randomBytes));
+console.log(`speedup ${(baseline / windowed).toFixed(2)}x, ${(baseline / precomputed).toFixed(2)}x with the key recoded ahead`);
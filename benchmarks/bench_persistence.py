@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from server_srav import Server_Srav
+from storage import encode_key
+
+LOGINS = 200
+
+
+def seed(db_path, n_devices):
+    Server_Srav(db_path).store.close()
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO user_devices VALUES (?, ?, ?)',
+                     ((f"user{i}", f"{i:016x}", encode_key(i + 2)) for i in range(n_devices)))
+    conn.commit()
+    conn.close()
+
+
+def bench_logins(n_devices, lazy=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed(db_path, n_devices)
+        start = time.perf_counter()
+        server = Server_Srav(db_path, lazy=lazy)
+        startup = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(LOGINS):
+            user_id = f"user{i * (n_devices // LOGINS)}"
+            key = server.user_devices[user_id][0]['public_ver_key']
+            challenge = server.generate_challenge(user_id)
+            server.verify_zkp_proof(user_id, challenge, pow(challenge, key, server.P))
+        elapsed = time.perf_counter() - start
+        server.store.close()
+    return startup * 1000, elapsed / LOGINS * 1000
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+    for n in sizes:
+        for lazy in (False, True):
+            startup_ms, login_ms = bench_logins(n, lazy)
+            mode = "lazy" if lazy else "eager"
+            print(f"{n:>9} devices {mode:>5}: startup {startup_ms:9.1f} ms, {login_ms:.3f} ms/login")
@@ -0,0 +1,93 @@
+import os
+import secrets
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from journal import JournalStore, make_store
+from records import Session
+from server_srav import Server_Srav
+from storage import SQLiteStore, _session_row
+
+TAIL = 50_000
+
+
+def rows(n_sessions):
+    # Ten sessions per user, each on the user's only device.
+    now = time.time()
+    devices = [(f"user{i}", f"{i:016x}", i + 2) for i in range(n_sessions // 10)]
+    sessions = [Session(secrets.token_hex(16), f"user{i // 10}", f"{i // 10:016x}", now, now + 3600)
+                for i in range(n_sessions)]
+    return devices, sessions
+
+
+def seed_sqlite(db_path, devices, sessions):
+    store = SQLiteStore(db_path)
+    store.add_devices(devices)
+    with store.transaction() as conn:
+        conn.executemany('INSERT INTO active_sessions VALUES (?, ?, ?, ?, ?)', map(_session_row, sessions))
+    store.close()
+
+
+def seed_journal(path, devices, sessions):
+    # One journal holding every change, no snapshot: the full history.
+    store = JournalStore(path, fsync=False, snapshot_every=0)
+    store.add_devices(devices)
+    with store.transaction():
+        for session in sessions:
+            store.put_session(session)
+    store.close(snapshot=False)
+
+
+def append_tail(path, n):
+    store = JournalStore(path, fsync=False, snapshot_every=0)
+    now = time.time()
+    with store.transaction():
+        for i in range(n):
+            store.put_session(Session(secrets.token_hex(16), "user0", f"{0:016x}", now, now + 3600))
+    store.close(snapshot=False)
+
+
+def timed_restart(path, store, lazy):
+    start = time.perf_counter()
+    server = Server_Srav(path, lazy=lazy, store=store)
+    elapsed = time.perf_counter() - start
+    if isinstance(server.store, JournalStore):
+        server.store.close(snapshot=False)  # keep the files as they were for the next run
+    else:
+        server.close()
+    return elapsed
+
+
+def size(tmp, prefix):
+    return sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp) if name.startswith(prefix))
+
+
+def report(label, tmp, prefix, path, store):
+    eager, lazy = timed_restart(path, store, False), timed_restart(path, store, True)
+    print(f"    {label:<28} {size(tmp, prefix) / 2**20:8.1f} MiB  eager {eager:6.2f} s  lazy {lazy:6.2f} s")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    journal = make_store('journal', fsync=False, snapshot_every=0)
+    for n in sizes:
+        devices, sessions = rows(n)
+        print(f"{n:>9} sessions, {len(devices)} devices:")
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "sqlite.db")
+            seed_sqlite(db_path, devices, sessions)
+            report("sqlite", tmp, "sqlite.db", db_path, SQLiteStore)
+
+            path = os.path.join(tmp, "journal.db")
+            seed_journal(path, devices, sessions)
+            report("journal only", tmp, "journal.db", path, journal)
+
+            start = time.perf_counter()
+            JournalStore(path, fsync=False, snapshot_every=0).close()
+            print(f"    replay + write snapshot      {time.perf_counter() - start:6.2f} s")
+            report("snapshot", tmp, "journal.db", path, journal)
+
+            append_tail(path, TAIL)
+            report(f"snapshot + {TAIL} tail", tmp, "journal.db", path, journal)
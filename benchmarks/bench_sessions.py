@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from metrics import Metrics
+from server_srav import Server_Srav
+from signed_tokens import TokenSigner
+
+USERS = 1000
+VALIDATIONS = 50_000
+
+
+def validations_per_sec(**server_args):
+    with tempfile.TemporaryDirectory() as tmp:
+        server = Server_Srav(os.path.join(tmp, "bench.db"), **server_args)
+        tokens = []
+        for i in range(USERS):
+            user_id = f"user{i}"
+            server.register_device(user_id, i + 2, suppress_output=True)
+            challenge = server.generate_challenge(user_id)
+            tokens.append((user_id, server.verify_zkp_proof(user_id, challenge, pow(challenge, i + 2, server.P))[1]))
+        start = time.perf_counter()
+        for n in range(VALIDATIONS):
+            user_id, token = tokens[n % USERS]
+            server.validate_session(user_id, token)
+        elapsed = time.perf_counter() - start
+        server.close()
+    return VALIDATIONS / elapsed
+
+
+if __name__ == "__main__":
+    modes = {
+        'stateful (in-memory)': {},
+        'stateful + metrics': {'metrics': Metrics()},
+        'stateful (lazy/SQLite)': {'lazy': True},
+        'signed': {'token_signer': TokenSigner(os.urandom(32))},
+    }
+    for name, server_args in modes.items():
+        print(f"{name:<24} {validations_per_sec(**server_args):>10.0f} validations/s")
@@ -0,0 +1,86 @@
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from server_srav import Server_Srav
+from storage import SESSION_COLUMNS, SQLiteStore, _session, decode_key
+
+P = 2**256 - 189
+
+
+def seed_v0(db_path, n_devices):
+    # The original sdi_l.db layout: decimal TEXT keys and one JSON token per user.
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE user_devices (user_id TEXT, device_id TEXT, public_ver_key TEXT, '
+                 'PRIMARY KEY (user_id, device_id))')
+    conn.execute('CREATE TABLE active_sessions (user_id TEXT PRIMARY KEY, token_json TEXT)')
+    conn.executemany('INSERT INTO user_devices VALUES (?, ?, ?)',
+                     ((f"user{i}", secrets.token_hex(8), str(secrets.randbelow(P))) for i in range(n_devices)))
+    now = time.time()
+    conn.executemany('INSERT INTO active_sessions VALUES (?, ?)', (
+        (f"user{i}", json.dumps({'user_id': f"user{i}", 'token_id': secrets.token_hex(16), 'issued_at': now,
+                                 'expires_at': now + 3600, 'device_used': secrets.token_hex(8)}))
+        for i in range(0, n_devices, 10)))
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def timed_v0_load(db_path):
+    # What Server_Srav did before the SQLiteStore: parse every key and token.
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    devices = {}
+    for user_id, device_id, key in conn.execute('SELECT user_id, device_id, public_ver_key FROM user_devices'):
+        devices.setdefault(user_id, []).append({'device_id': device_id, 'public_ver_key': int(key)})
+    sessions = {user_id: json.loads(token) for user_id, token in
+                conn.execute('SELECT user_id, token_json FROM active_sessions')}
+    conn.close()
+    return time.perf_counter() - start
+
+
+def timed_v2_load(db_path):
+    # The same rows read back into the same shapes from the v2 layout.
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    devices = {}
+    for user_id, device_id, key in conn.execute('SELECT user_id, device_id, public_ver_key FROM user_devices'):
+        devices.setdefault(user_id, []).append({'device_id': device_id, 'public_ver_key': decode_key(key)})
+    sessions = {session.token_id: session for session in
+                map(_session, conn.execute(f'SELECT {SESSION_COLUMNS} FROM active_sessions'))}
+    conn.close()
+    return time.perf_counter() - start
+
+
+def timed_server_start(db_path):
+    # Everything Server_Srav does on top: sharded device lists, session indexes, expiry wheel.
+    start = time.perf_counter()
+    Server_Srav(db_path).close()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            seed_v0(db_path, n)
+            before_size = os.path.getsize(db_path)
+            before_load = timed_v0_load(db_path)
+
+            start = time.perf_counter()
+            SQLiteStore(db_path).close()
+            migration = time.perf_counter() - start
+            after_size = os.path.getsize(db_path)
+            after_load = timed_v2_load(db_path)
+            server_start = timed_server_start(db_path)
+
+        print(f"{n:>9} devices, {n // 10} sessions: migration {migration:6.2f} s")
+        print(f"    TEXT/JSON  {before_size / 2**20:8.1f} MiB  load rows {before_load * 1000:8.0f} ms")
+        print(f"    BLOB (v2)  {after_size / 2**20:8.1f} MiB  load rows {after_load * 1000:8.0f} ms"
+              f"  full Server_Srav start {server_start * 1000:8.0f} ms")
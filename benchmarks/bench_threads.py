@@ -0,0 +1,67 @@
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from server_srav import Server_Srav
+
+USERS = 1000
+VALIDATIONS = 64_000
+THREADS = (1, 4, 16, 64)
+LOGIN_EVERY = 10  # in the mixed workload, one login per this many validations
+NO_LOCK = contextlib.nullcontext()
+
+
+def seed(server):
+    tokens = []
+    for i in range(USERS):
+        user_id = f"user{i}"
+        server.register_device(user_id, i + 2, suppress_output=True)
+        challenge = server.generate_challenge(user_id)
+        tokens.append((user_id, server.verify_zkp_proof(user_id, challenge, pow(challenge, i + 2, server.P))[1]))
+    return tokens
+
+
+def run(server, tokens, threads, lock, mixed):
+    # lock=None is the sharded store as is; a Lock around every call is what
+    # serializing all requests on one global lock would cost.
+    per_thread = VALIDATIONS // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def client(t):
+        barrier.wait()
+        for n in range(per_thread):
+            user_id, token = tokens[(t * per_thread + n) % USERS]
+            with lock or NO_LOCK:
+                server.validate_session(user_id, token)
+            if mixed and n % LOGIN_EVERY == 0:
+                with lock or NO_LOCK:
+                    challenge = server.generate_challenge(user_id)
+                proof = pow(challenge, int(user_id[4:]) + 2, server.P)
+                with lock or NO_LOCK:
+                    server.verify_zkp_proof(user_id, challenge, proof)
+
+    workers = [threading.Thread(target=client, args=(t,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        server = Server_Srav(os.path.join(tmp, "bench.db"))
+        tokens = seed(server)
+        for mixed in (False, True):
+            print("validate + 1 login per 10" if mixed else "validate only")
+            for threads in THREADS:
+                sharded = run(server, tokens, threads, None, mixed)
+                locked = run(server, tokens, threads, threading.Lock(), mixed)
+                print(f"  threads={threads:<3} sharded {sharded:>10.0f}/s   one global lock {locked:>10.0f}/s")
+        server.close()
@@ -0,0 +1,41 @@
+import os
+import secrets
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from verifier import ProofVerifier
+
+P = 2**256 - 189
+ROUNDS = 20
+
+
+def naive_match(challenge, proof, devices, device_id=None):
+    for device in devices:
+        if pow(challenge, device['public_ver_key'], P) == proof:
+            return device['device_id']
+    return None
+
+
+def verifies_per_sec(match, devices, hinted=False, valid=True):
+    target = devices[-1]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        challenge = secrets.randbelow(P)
+        proof = pow(challenge, target['public_ver_key'], P) + (0 if valid else 1)
+        match(challenge, proof, devices, target['device_id'] if hinted else None)
+    return ROUNDS / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    verifier = ProofVerifier(P)
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4, 8, 16, 32, 64]
+    print(f"{'devices':>7} {'naive':>9} {'engine':>9} {'hinted':>9} {'naive-fail':>11} {'engine-fail':>11}")
+    for n in counts:
+        devices = [{'device_id': secrets.token_hex(8), 'public_ver_key': secrets.randbelow(P)} for _ in range(n)]
+        print(f"{n:>7} "
+              f"{verifies_per_sec(naive_match, devices):>9.0f} "
+              f"{verifies_per_sec(verifier.match, devices):>9.0f} "
+              f"{verifies_per_sec(verifier.match, devices, hinted=True):>9.0f} "
+              f"{verifies_per_sec(naive_match, devices, valid=False):>11.0f} "
+              f"{verifies_per_sec(verifier.match, devices, valid=False):>11.0f}")
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import os
+import secrets
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from crypto_executor import CryptoExecutor
+from user_device import HeadlessWallet, SDILWallet, always_unlock
+
+
+def traced_bytes(build):
+    # Memory is measured in a separate run: tracemalloc slows allocation-heavy code.
+    tracemalloc.start()
+    keep = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return memory
+
+
+def per_client_wallets(n):
+    with contextlib.redirect_stdout(io.StringIO()):
+        wallets = [SDILWallet(unlock_policy=always_unlock) for _ in range(n)]
+        for wallet in wallets:
+            wallet.generate_keys()
+    return wallets
+
+
+def bench_per_client_wallets(n):
+    # One SDILWallet per synthetic client: keys per second and bytes per identity.
+    start = time.perf_counter()
+    wallets = per_client_wallets(n)
+    elapsed = time.perf_counter() - start
+    memory = traced_bytes(lambda: per_client_wallets(n))
+
+    challenges = [secrets.randbelow(wallets[0].P) for _ in range(n)]
+    start = time.perf_counter()
+    for wallet, challenge in zip(wallets, challenges):
+        wallet.generate_zkp_proof(challenge, suppress_output=True)
+    return n / elapsed, n / (time.perf_counter() - start), memory / n
+
+
+def headless_wallet(n):
+    wallet = HeadlessWallet()
+    wallet.generate_keys(n)
+    return wallet
+
+
+def bench_headless(n, executor):
+    wallet = HeadlessWallet(executor)
+    start = time.perf_counter()
+    indices = wallet.generate_keys(n)
+    elapsed = time.perf_counter() - start
+    memory = traced_bytes(lambda: headless_wallet(n))
+
+    wallet.unlock()
+    challenges = [secrets.randbelow(wallet.P) for _ in range(n)]
+    start = time.perf_counter()
+    wallet.generate_zkp_proofs(indices, challenges)
+    return n / elapsed, n / (time.perf_counter() - start), memory / n
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rows = [('SDILWallet per client', bench_per_client_wallets(n)),
+            ('HeadlessWallet inline', bench_headless(n, None))]
+    for workers in sorted({2, os.cpu_count() or 1}):
+        executor = CryptoExecutor(workers)
+        executor.start()
+        rows.append((f"HeadlessWallet workers={workers}", bench_headless(n, executor)))
+        executor.shutdown()
+    print(f"{n} identities")
+    for name, (keys, proofs, per_identity) in rows:
+        print(f"  {name:<28} keys {keys:>9.0f}/s  proofs {proofs:>9.0f}/s  {per_identity:>6.0f} B/identity")
@@ -0,0 +1,52 @@
+import os
+import secrets
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from crypto_executor import CryptoExecutor
+from server_srav import Server_Srav
+
+THREADS = 32
+LOGINS_PER_THREAD = 20
+DEVICES_PER_USER = 4
+
+
+def run(workers):
+    executor = CryptoExecutor(workers)
+    executor.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        server = Server_Srav(os.path.join(tmp, "load.db"), executor=executor)
+        keys = {}
+        for t in range(THREADS):
+            user_id = f"user{t}"
+            for _ in range(DEVICES_PER_USER):
+                keys[user_id] = secrets.randbelow(server.P)
+                server.register_device(user_id, keys[user_id], suppress_output=True)
+
+        def client(user_id):
+            # The proof comes from the last registered device, so every
+            # verification walks the user's full device list.
+            for _ in range(LOGINS_PER_THREAD):
+                challenge = server.generate_challenge(user_id)
+                proof = pow(challenge, keys[user_id], server.P)
+                server.verify_zkp_proof(user_id, challenge, proof)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(THREADS) as threads:
+            list(threads.map(client, keys))
+        elapsed = time.perf_counter() - start
+        server.close()
+    stats = executor.stats()
+    executor.shutdown()
+    return THREADS * LOGINS_PER_THREAD / elapsed, stats
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or sorted({0, 1, 2, 4, os.cpu_count() or 1})
+    for workers in counts:
+        throughput, stats = run(workers)
+        print(f"workers={workers:<3} {throughput:8.1f} logins/s  "
+              f"latency avg {stats['latency_ms_avg']:.2f} ms max {stats['latency_ms_max']:.2f} ms")
@@ -0,0 +1,82 @@
+"""Drive register -> challenge -> verify -> validate against a running SDI-L API.
+
+Start either server locally, then point this script at it:
+
+    python src/app.py          # Flask, http://127.0.0.1:5000
+    python src/asgi_app.py     # ASGI,  http://127.0.0.1:8000
+    python benchmarks/load_http.py http://127.0.0.1:8000 --clients 500
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from urllib.parse import urlsplit
+
+P = 2**256 - 189
+
+
+async def request(host, port, method, path, payload=None):
+    # One connection per request keeps the client simple and works with the
+    # HTTP/1.0-style Werkzeug dev server as well as uvicorn.
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), json.loads(data or b'null')
+
+
+async def client(host, port, n, rounds, latencies, errors):
+    user_id = f"load-{secrets.token_hex(4)}-{n}"
+    key = secrets.randbelow(P)
+    status, _ = await request(host, port, 'POST', '/register_device',
+                              {'user_id': user_id, 'public_ver_key': str(key)})
+    if status != 201:
+        errors.append(status)
+        return
+    for _ in range(rounds):
+        start = time.perf_counter()
+        status, data = await request(host, port, 'POST', '/generate_challenge', {'user_id': user_id})
+        if status != 200:
+            errors.append(status)
+            continue
+        challenge = int(data['challenge'])
+        status, data = await request(host, port, 'POST', '/verify_proof', {
+            'user_id': user_id, 'challenge': str(challenge), 'proof': str(pow(challenge, key, P))})
+        if status != 200:
+            errors.append(status)
+            continue
+        status, data = await request(host, port, 'POST', '/validate_session',
+                                     {'user_id': user_id, 'token': data['token']})
+        if status != 200 or not data['valid']:
+            errors.append(status)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(url, clients, rounds):
+    parts = urlsplit(url)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(parts.hostname, parts.port or 80, n, rounds, latencies, errors)
+                           for n in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{url}: {len(latencies)} logins in {elapsed:.2f}s ({len(latencies) / elapsed:.1f}/s), "
+          f"{len(errors)} errors")
+    if latencies:
+        print(f"login latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.clients, args.rounds))
@@ -0,0 +1,283 @@
+"""Benchmark suite for the wallet, the server and the HTTP API, with JSON output.
+
+    python benchmarks/suite.py --out results.json
+    python benchmarks/suite.py --quick --parts micro,storage
+    python benchmarks/suite.py --parts e2e --url http://127.0.0.1:8000
+    python benchmarks/suite.py --out new.json --compare results.json
+
+Parts:
+  micro    SDILWallet.generate_keys / generate_zkp_proof and
+           Server_Srav.verify_zkp_proof across device counts
+  storage  startup, device lookups and session writes across DB sizes
+  e2e      register -> challenge -> verify -> validate through the Flask
+           test client (in process), or against a running server with --url
+
+--compare exits with status 1 if any result is more than --threshold slower
+than the same result in the baseline file.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+sys.path.insert(0, SRC_DIR)
+
+from server_srav import Server_Srav
+from storage import SQLiteStore
+from user_device import SDILWallet
+
+P = 2**256 - 189
+
+
+def summarize(samples):
+    # samples are per-operation durations in seconds.
+    ordered = sorted(samples)
+    return {
+        'ops': len(ordered),
+        'ops_per_sec': len(ordered) / sum(ordered) if sum(ordered) else 0.0,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+    }
+
+
+def timed(fn, n, setup=None):
+    samples = []
+    for _ in range(n):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def result(part, name, params, stats):
+    return dict({'part': part, 'name': name, 'params': params}, **stats)
+
+
+def bench_micro(quick):
+    rounds = 50 if quick else 300
+    results = []
+    wallet = SDILWallet()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.append(result('micro', 'wallet.generate_keys', {}, timed(wallet.generate_keys, rounds)))
+    results.append(result('micro', 'wallet.generate_zkp_proof', {}, timed(
+        wallet.generate_zkp_proof, rounds, lambda: (secrets.randbelow(P), True))))
+
+    for n_devices in ([1, 16] if quick else [1, 4, 16, 64]):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = Server_Srav(os.path.join(tmp, "micro.db"))
+            keys = [secrets.randbelow(P - 1) + 1 for _ in range(n_devices)]
+            device_ids = [server.register_device("alice", key, suppress_output=True) for key in keys]
+            for hinted in (False, True):
+                # Prove with the last device: the worst case for an unhinted scan.
+                def setup():
+                    challenge = server.generate_challenge("alice")
+                    return ("alice", challenge, pow(challenge, keys[-1], P), device_ids[-1] if hinted else None)
+                stats = timed(server.verify_zkp_proof, max(rounds // n_devices, 20), setup)
+                results.append(result('micro', 'server.verify_zkp_proof',
+                                      {'devices': n_devices, 'hinted': hinted}, stats))
+            server.close()
+    return results
+
+
+def bench_storage(quick):
+    results = []
+    for n_devices in ([10_000, 100_000] if quick else [10_000, 100_000, 1_000_000]):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "storage.db")
+            store = SQLiteStore(db_path)
+            for offset in range(0, n_devices, 50_000):
+                store.add_devices((f"user{i}", f"{i:016x}", i + 2)
+                                  for i in range(offset, min(offset + 50_000, n_devices)))
+            store.close()
+            params = {'devices': n_devices}
+            results.append(result('storage', 'db_size', params, {'bytes': os.path.getsize(db_path)}))
+
+            for lazy in (False, True):
+                start = time.perf_counter()
+                server = Server_Srav(db_path, lazy=lazy)
+                elapsed = time.perf_counter() - start
+                results.append(result('storage', 'startup', dict(params, lazy=lazy), {'seconds': elapsed}))
+                if lazy:
+                    results.append(result('storage', 'store.get_devices', params, timed(
+                        server.store.get_devices, 2000, lambda: (f"user{secrets.randbelow(n_devices)}",))))
+                    user_ids = iter(range(10**9))
+
+                    def login():
+                        user_id = f"user{next(user_ids) % n_devices}"
+                        challenge = server.generate_challenge(user_id)
+                        server.verify_zkp_proof(user_id, challenge, pow(challenge, int(user_id[4:]) + 2, P))
+                    results.append(result('storage', 'login_with_session_write', params, timed(login, 300)))
+                server.close()
+    return results
+
+
+def e2e_sequence(call, user_id, key, steps):
+    # call(method, path, payload) -> (status, body); records one duration per step.
+    start = time.perf_counter()
+    status, body = call('POST', '/register_device', {'user_id': user_id, 'public_ver_key': str(key)})
+    steps['register'].append(time.perf_counter() - start)
+    if status != 201:
+        return False
+    start = time.perf_counter()
+    status, body = call('POST', '/generate_challenge', {'user_id': user_id})
+    steps['challenge'].append(time.perf_counter() - start)
+    if status != 200:
+        return False
+    challenge = int(body['challenge'])
+    start = time.perf_counter()
+    status, body = call('POST', '/verify_proof', {'user_id': user_id, 'challenge': str(challenge),
+                                                  'proof': str(pow(challenge, key, P))})
+    steps['verify'].append(time.perf_counter() - start)
+    if status != 200:
+        return False
+    start = time.perf_counter()
+    status, body = call('POST', '/validate_session', {'user_id': user_id, 'token': body['token']})
+    steps['validate'].append(time.perf_counter() - start)
+    return status == 200 and body['valid']
+
+
+def bench_e2e(quick, url=None):
+    users = 100 if quick else 1000
+    steps = {'register': [], 'challenge': [], 'verify': [], 'validate': []}
+    if url is None:
+        target = 'flask-test-client'
+        tmp = tempfile.TemporaryDirectory()
+        os.environ['SDIL_DB_PATH'] = os.path.join(tmp.name, "e2e.db")
+        import app as flask_app
+        client = flask_app.app.test_client()
+
+        def call(method, path, payload):
+            response = client.open(path, method=method, json=payload)
+            return response.status_code, response.get_json()
+    else:
+        target = url
+        sys.path.insert(0, BENCH_DIR)
+        from load_http import request
+        parts = urlsplit(url)
+        loop = asyncio.new_event_loop()
+
+        def call(method, path, payload):
+            return loop.run_until_complete(request(parts.hostname, parts.port or 80, method, path, payload))
+
+    failures = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n in range(users):
+            failures += not e2e_sequence(call, f"bench-{secrets.token_hex(4)}-{n}", secrets.randbelow(P - 1) + 1, steps)
+    elapsed = time.perf_counter() - start
+
+    params = {'target': target}
+    results = [result('e2e', f"http.{step}", params, summarize(samples)) for step, samples in steps.items() if samples]
+    results.append(result('e2e', 'http.full_sequence', params,
+                          {'sequences_per_sec': users / elapsed, 'failures': failures}))
+    if url is not None:
+        loop.close()
+    else:
+        flask_app.crypto_executor.shutdown()
+        flask_app.server.close()
+        tmp.cleanup()
+    return results
+
+
+def metadata():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                  capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'timestamp': time.time(),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def result_key(entry):
+    return entry['part'], entry['name'], json.dumps(entry['params'], sort_keys=True)
+
+
+def headline(entry):
+    # The number a regression check compares. Medians are preferred over
+    # means, which a single GC pause or page-cache miss can swing.
+    for field, higher_is_better in (('p50_ms', False), ('sequences_per_sec', True),
+                                    ('seconds', False), ('bytes', False)):
+        if field in entry:
+            return field, entry[field], higher_is_better
+    return None
+
+
+def compare(baseline, current, threshold):
+    previous = {result_key(entry): entry for entry in baseline['results']}
+    regressions = 0
+    for entry in current['results']:
+        old = previous.get(result_key(entry))
+        now = headline(entry)
+        if old is None or now is None or now[0] not in old or not old[now[0]]:
+            continue
+        field, value, higher_is_better = now
+        ratio = value / old[field]
+        slower = ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold
+        regressions += slower
+        flag = '  REGRESSION' if slower else ''
+        print(f"{entry['part']:<8} {entry['name']:<28} {json.dumps(entry['params']):<36} "
+              f"{field} {old[field]:.4g} -> {value:.4g} ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def print_results(results):
+    for entry in results:
+        if 'p50_ms' in entry:
+            summary = f"{entry['ops_per_sec']:>9.0f} ops/s  p50 {entry['p50_ms']:.3f} ms  p99 {entry['p99_ms']:.3f} ms"
+        else:
+            field, value, _ = headline(entry)
+            summary = f"{field} {value:.4g}"
+        print(f"{entry['part']:<8} {entry['name']:<28} {json.dumps(entry['params']):<36} {summary}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', default='micro,storage,e2e')
+    parser.add_argument('--quick', action='store_true', help="fewer rounds and smaller databases")
+    parser.add_argument('--url', help="run the e2e part against a running server instead of the test client")
+    parser.add_argument('--out', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    runners = {'micro': lambda: bench_micro(args.quick),
+               'storage': lambda: bench_storage(args.quick),
+               'e2e': lambda: bench_e2e(args.quick, args.url)}
+    report = {'meta': metadata(), 'results': []}
+    for part in args.parts.split(','):
+        results = runners[part]()
+        print_results(results)
+        report['results'].extend(results)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
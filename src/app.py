@@ -1,12 +1,34 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g
+import io
 import sys
 import os
+import time
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from server_srav import Server_Srav
+import bulk
+import config
+import logs
+from backends import SharedTableFull
+from listing import parse_page
+from ratelimit import RateLimited
+from service import build_server
 
 app = Flask(__name__)
-server = Server_Srav()
+logs.configure(config.LOG_LEVEL, mode=config.LOG_MODE)
+server, crypto_executor, metrics, device_listings = build_server(config)
+server.start_expiry(config.EXPIRY_INTERVAL)
+
+if metrics is not None:
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('sdil_http_request_seconds', time.perf_counter() - g.request_start, labels=f'route="{route}"')
+        metrics.inc('sdil_http_requests_total', labels=f'route="{route}",status="{response.status_code}"')
+        return response
 
 
 @app.route('/')
@@ -22,8 +44,9 @@ def register_device():
         return jsonify({'error': 'Missing user_id or public_ver_key (str)'}), 400
     try:
         public_ver_key = int(public_ver_key_str)
-        server.register_device(user_id, public_ver_key)
-        return jsonify({'message': 'Device registered', 'devices': server.get_registered_devices(user_id)}), 201
+        device_id = server.register_device(user_id, public_ver_key)
+        return jsonify({'message': 'Device registered', 'device_id': device_id,
+                        'devices': server.get_registered_devices(user_id)}), 201
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
 
@@ -34,8 +57,12 @@ def generate_challenge():
     if not user_id:
         return jsonify({'error': 'Missing user_id'}), 400
     try:
-        challenge = server.generate_challenge(user_id)
-        return jsonify({'challenge': challenge, 'issued_at': server.challenge_timestamps.get(user_id, 0)}), 200
+        challenge, issued = server.issue_challenge(user_id)
+        return jsonify({'challenge': challenge, 'issued_at': issued.issued_at}), 200
+    except RateLimited as e:
+        return jsonify({'error': str(e)}), 429
+    except SharedTableFull as e:
+        return jsonify({'error': str(e)}), 503
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
 
@@ -45,17 +72,58 @@ def verify_proof():
     user_id = data.get('user_id')
     challenge = data.get('challenge')
     proof = data.get('proof')
+    device_id = data.get('device_id')
     if not all([user_id, challenge, proof]):
         return jsonify({'error': 'Missing user_id, challenge, or proof'}), 400
     try:
-        verified, token = server.verify_zkp_proof(user_id, int(challenge), int(proof))
+        verified, token = server.verify_zkp_proof(user_id, int(challenge), int(proof), device_id)
         if verified:
             return jsonify({'verified': True, 'token': token}), 200
         else:
             return jsonify({'verified': False, 'error': 'Invalid proof or TTL exceeded'}), 401
+    except SharedTableFull as e:
+        return jsonify({'error': str(e)}), 503
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/verify_proof_batch', methods=['POST'])
+def verify_proof_batch():
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Missing items'}), 400
+    if len(items) > config.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Too many items (max {config.BATCH_MAX_ITEMS})'}), 400
+
+    # Each item gets the body and status code /verify_proof would have returned for it.
+    results = [None] * len(items)
+    batch, positions = [], []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {'status': 400, 'error': 'Item must be a JSON object'}
+            continue
+        user_id = item.get('user_id')
+        challenge = item.get('challenge')
+        proof = item.get('proof')
+        if not all([user_id, challenge, proof]):
+            results[i] = {'status': 400, 'error': 'Missing user_id, challenge, or proof'}
+            continue
+        try:
+            batch.append((user_id, int(challenge), int(proof), item.get('device_id')))
+        except (TypeError, ValueError) as e:
+            results[i] = {'status': 400, 'error': str(e)}
+            continue
+        positions.append(i)
+
+    for i, (verified, token, error) in zip(positions, server.verify_zkp_proof_batch(batch)):
+        if error is not None:
+            results[i] = {'status': 503 if isinstance(error, SharedTableFull) else 400, 'error': str(error)}
+        elif verified:
+            results[i] = {'status': 200, 'verified': True, 'token': token}
+        else:
+            results[i] = {'status': 401, 'verified': False, 'error': 'Invalid proof or TTL exceeded'}
+    return jsonify({'results': results}), 200
+
 @app.route('/validate_session', methods=['POST'])
 def validate_session():
     data = request.json
@@ -72,13 +140,41 @@ def revoke_session():
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'Missing user_id'}), 400
-    revoked = server.revoke_session(user_id)
+    # token_id revokes one session, device_id every session of that device,
+    # neither every session of the user.
+    if data.get('device_id'):
+        revoked = server.revoke_device_sessions(user_id, data['device_id'])
+    else:
+        revoked = server.revoke_session(user_id, data.get('token_id'))
     return jsonify({'revoked': revoked}), 200
 
+@app.route('/import_devices', methods=['POST'])
+def import_devices():
+    # Body is NDJSON, or CSV with Content-Type text/csv; read as a stream, not buffered.
+    fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    stats = server.import_devices(bulk.read_records(stream, fmt))
+    stats['errors'] = [{'line': line_no, 'error': error} for line_no, error in stats['errors']]
+    return jsonify(stats), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
 @app.route('/devices/<user_id>', methods=['GET'])
 def get_devices(user_id):
-    devices = server.get_registered_devices(user_id)
-    return jsonify({'user_id': user_id, 'devices': devices}), 200
+    # ?offset=&limit= pages through large device lists; If-None-Match with
+    # the last ETag gets a 304 while the user's devices are unchanged.
+    try:
+        offset, limit = parse_page(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    etag, body = device_listings.respond(user_id, request.headers.get('If-None-Match'), offset, limit)
+    if body is None:
+        return '', 304, {'ETag': etag}
+    return body, 200, {'Content-Type': 'application/json', 'ETag': etag}
 
 if __name__ == '__main__':
     print("SDI-L API Server starting on http://localhost:5000")
@@ -0,0 +1,289 @@
+"""ASGI entry point: the Flask app's JSON API on an event loop.
+
+Every route of app.py is served here except two: GET /, the HTML page,
+and POST /import_devices, the streamed NDJSON upload. Both stay Flask-only.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import logs
+from backends import SharedTableFull
+from listing import parse_page
+from ratelimit import RateLimited
+from service import build_server
+from verifier import match_device
+
+
+class AsyncServer:
+    """Async facade over Server_Srav for the ASGI entry point.
+
+    Every state or storage call runs on a single dedicated thread, so the
+    event loop never blocks on SQLite and Server_Srav's dicts are only
+    touched by one thread. Proof matching, the CPU-heavy step, runs in
+    parallel with that thread: on the server's crypto executor when the
+    server would offload it, otherwise on the loop's default thread pool.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._state = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sdil-state')
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._state, fn, *args)
+
+    async def register_device(self, user_id, public_ver_key):
+        device_id = await self._call(self.server.register_device, user_id, public_ver_key, True)
+        return device_id, await self.get_registered_devices(user_id)
+
+    async def get_registered_devices(self, user_id):
+        return await self._call(self.server.get_registered_devices, user_id)
+
+    async def device_listing(self, listings, user_id, if_none_match, offset, limit):
+        return await self._call(listings.respond, user_id, if_none_match, offset, limit)
+
+    async def generate_challenge(self, user_id):
+        challenge, issued = await self._call(self.server.issue_challenge, user_id)
+        return challenge, issued.issued_at
+
+    async def verify_zkp_proof(self, user_id, challenge, proof, device_id=None):
+        metrics = self.server.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        try:
+            return await self._verify_zkp_proof(user_id, challenge, proof, device_id)
+        finally:
+            if metrics is not None:
+                metrics.observe('sdil_verify_seconds', time.perf_counter() - start)
+
+    async def _verify_zkp_proof(self, user_id, challenge, proof, device_id):
+        match = await self._call(self.server.prepare_verification, user_id, challenge, proof, device_id)
+        started = time.perf_counter() if self.server.metrics is not None else None
+        if match.offload:
+            verified_with_device = await asyncio.wrap_future(self.server.executor.submit(match_device, *match.args))
+        else:
+            verified_with_device = await asyncio.get_running_loop().run_in_executor(None, match_device, *match.args)
+        return await self._call(self.server.complete_verification, match, verified_with_device, started)
+
+    async def verify_zkp_proof_batch(self, items):
+        # Like verify_zkp_proof: the matches run concurrently off the state
+        # thread, and every session is then written in one transaction.
+        results, jobs = await self._call(self.server.prepare_batch, items)
+        started = time.perf_counter() if self.server.metrics is not None else None
+        if self.server.executor is not None:
+            futures = [asyncio.wrap_future(self.server.executor.submit(match_device, *match.args))
+                       for _, match in jobs]
+        else:
+            loop = asyncio.get_running_loop()
+            futures = [loop.run_in_executor(None, match_device, *match.args) for _, match in jobs]
+        matches = await asyncio.gather(*futures)
+        return await self._call(self.server.complete_batch, results, jobs, matches, started)
+
+    async def validate_session(self, user_id, token):
+        return await self._call(self.server.validate_session, user_id, token)
+
+    async def revoke_session(self, user_id, token_id=None):
+        return await self._call(self.server.revoke_session, user_id, token_id)
+
+    async def revoke_device_sessions(self, user_id, device_id):
+        return await self._call(self.server.revoke_device_sessions, user_id, device_id)
+
+    async def run_expiry(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self._call(self.server.expire_entries)
+
+    def close(self):
+        self._state.shutdown()
+
+
+async def register_device(data):
+    user_id = data.get('user_id')
+    public_ver_key_str = data.get('public_ver_key')
+    if not user_id or not public_ver_key_str:
+        return {'error': 'Missing user_id or public_ver_key (str)'}, 400
+    try:
+        device_id, devices = await async_server.register_device(user_id, int(public_ver_key_str))
+        return {'message': 'Device registered', 'device_id': device_id, 'devices': devices}, 201
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+
+async def generate_challenge(data):
+    user_id = data.get('user_id')
+    if not user_id:
+        return {'error': 'Missing user_id'}, 400
+    try:
+        challenge, issued_at = await async_server.generate_challenge(user_id)
+        return {'challenge': challenge, 'issued_at': issued_at}, 200
+    except RateLimited as e:
+        return {'error': str(e)}, 429
+    except SharedTableFull as e:
+        return {'error': str(e)}, 503
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+
+async def verify_proof(data):
+    user_id = data.get('user_id')
+    challenge = data.get('challenge')
+    proof = data.get('proof')
+    device_id = data.get('device_id')
+    if not all([user_id, challenge, proof]):
+        return {'error': 'Missing user_id, challenge, or proof'}, 400
+    try:
+        verified, token = await async_server.verify_zkp_proof(user_id, int(challenge), int(proof), device_id)
+        if verified:
+            return {'verified': True, 'token': token}, 200
+        else:
+            return {'verified': False, 'error': 'Invalid proof or TTL exceeded'}, 401
+    except SharedTableFull as e:
+        return {'error': str(e)}, 503
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+
+async def verify_proof_batch(data):
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return {'error': 'Missing items'}, 400
+    if len(items) > config.BATCH_MAX_ITEMS:
+        return {'error': f'Too many items (max {config.BATCH_MAX_ITEMS})'}, 400
+
+    # Each item gets the body and status code /verify_proof would have returned for it.
+    results = [None] * len(items)
+    batch, positions = [], []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {'status': 400, 'error': 'Item must be a JSON object'}
+            continue
+        user_id = item.get('user_id')
+        challenge = item.get('challenge')
+        proof = item.get('proof')
+        if not all([user_id, challenge, proof]):
+            results[i] = {'status': 400, 'error': 'Missing user_id, challenge, or proof'}
+            continue
+        try:
+            batch.append((user_id, int(challenge), int(proof), item.get('device_id')))
+        except (TypeError, ValueError) as e:
+            results[i] = {'status': 400, 'error': str(e)}
+            continue
+        positions.append(i)
+
+    for i, (verified, token, error) in zip(positions, await async_server.verify_zkp_proof_batch(batch)):
+        if error is not None:
+            results[i] = {'status': 503 if isinstance(error, SharedTableFull) else 400, 'error': str(error)}
+        elif verified:
+            results[i] = {'status': 200, 'verified': True, 'token': token}
+        else:
+            results[i] = {'status': 401, 'verified': False, 'error': 'Invalid proof or TTL exceeded'}
+    return {'results': results}, 200
+
+
+async def validate_session(data):
+    user_id = data.get('user_id')
+    token = data.get('token')
+    if not user_id or not token:
+        return {'error': 'Missing user_id or token'}, 400
+    return {'valid': await async_server.validate_session(user_id, token)}, 200
+
+
+async def revoke_session(data):
+    user_id = data.get('user_id')
+    if not user_id:
+        return {'error': 'Missing user_id'}, 400
+    if data.get('device_id'):
+        return {'revoked': await async_server.revoke_device_sessions(user_id, data['device_id'])}, 200
+    return {'revoked': await async_server.revoke_session(user_id, data.get('token_id'))}, 200
+
+
+async def get_devices(send, user_id, query, if_none_match):
+    try:
+        offset, limit = parse_page(dict(parse_qsl(query)))
+    except ValueError as e:
+        return await send_json(send, {'error': str(e)}, 400)
+    etag, body = await async_server.device_listing(device_listings, user_id, if_none_match, offset, limit)
+    headers = [(b'etag', etag.encode())]
+    if body is None:
+        return await send_body(send, b'', 304, None, headers)
+    await send_body(send, body, 200, b'application/json', headers)
+
+
+POST_ROUTES = {
+    '/register_device': register_device,
+    '/generate_challenge': generate_challenge,
+    '/verify_proof': verify_proof,
+    '/verify_proof_batch': verify_proof_batch,
+    '/validate_session': validate_session,
+    '/revoke_session': revoke_session,
+}
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, payload, status):
+    await send_body(send, json.dumps(payload).encode(), status, b'application/json')
+
+
+async def send_body(send, body, status, content_type, headers=()):
+    headers = [(b'content-length', str(len(body)).encode()), *headers]
+    if content_type is not None:
+        headers.append((b'content-type', content_type))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        expiry = None
+        while (await receive())['type'] != 'lifespan.shutdown':
+            expiry = asyncio.create_task(async_server.run_expiry(config.EXPIRY_INTERVAL))
+            await send({'type': 'lifespan.startup.complete'})
+        if expiry is not None:
+            expiry.cancel()
+        async_server.close()
+        crypto_executor.shutdown()
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+    path, method = scope['path'], scope['method']
+    if method == 'POST' and path in POST_ROUTES:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return await send_json(send, {'error': 'Request body must be a JSON object'}, 400)
+        payload, status = await POST_ROUTES[path](data)
+    elif method == 'GET' and path == '/metrics' and metrics is not None:
+        return await send_body(send, metrics.render().encode(), 200, b'text/plain; version=0.0.4')
+    elif method == 'GET' and path.startswith('/devices/') and len(path) > len('/devices/'):
+        if_none_match = dict(scope['headers']).get(b'if-none-match', b'').decode('latin-1')
+        return await get_devices(send, path[len('/devices/'):], scope['query_string'].decode('latin-1'),
+                                 if_none_match)
+    else:
+        payload, status = {'error': 'Not found'}, 404
+    await send_json(send, payload, status)
+
+
+logs.configure(config.LOG_LEVEL, mode=config.LOG_MODE)
+server, crypto_executor, metrics, device_listings = build_server(config)
+async_server = AsyncServer(server)
+
+if __name__ == '__main__':
+    import uvicorn
+    print("SDI-L async API Server starting on http://localhost:8000")
+    uvicorn.run(app, host='0.0.0.0', port=8000)
@@ -0,0 +1,358 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from records import Challenge, PendingChallenges, Session, ShardedSessionIndex
+
+_MISSING = object()
+
+
+class SharedTableFull(ValueError):
+    """A shared table has no free slot; HTTP entry points answer 503."""
+
+
+class MemoryBackend:
+    """Process-local indexes: the original single-worker behaviour.
+
+    Sessions are sharded by user with a lock per shard, so request threads
+    can share one server.
+    """
+
+    shared = False
+
+    def __init__(self, store=None, max_challenges=None, shards=16):
+        # A store that persists pending challenges (journal.JournalStore)
+        # hands out its own map, restored from the last run.
+        if hasattr(store, 'pending_challenges'):
+            self.challenges = store.pending_challenges(max_challenges)
+        else:
+            self.challenges = PendingChallenges(max_challenges)
+        self.sessions = ShardedSessionIndex(shards)
+
+
+class SQLiteChallengeMap:
+    """Pending challenges as rows of a WAL table, shared by every process on the DB."""
+
+    def __init__(self, store):
+        self.store = store
+        with store.transaction() as conn:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(pending_challenges)')}
+            if columns and 'challenge_id' not in columns:
+                # Pre-v1 table keyed by user_id; pending challenges are short-lived, so start afresh.
+                conn.execute('DROP TABLE pending_challenges')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pending_challenges (
+                    challenge_id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    issued_at REAL
+                )
+            ''')
+
+    def get(self, challenge_id, default=None):
+        with self.store.lock:
+            row = self.store.conn.execute(
+                'SELECT challenge_id, user_id, issued_at FROM pending_challenges WHERE challenge_id = ?',
+                (challenge_id,)).fetchone()
+        return Challenge(*row) if row else default
+
+    def pop(self, challenge_id, default=_MISSING):
+        # DELETE ... RETURNING makes consuming a challenge atomic across processes.
+        with self.store.transaction() as conn:
+            rows = conn.execute('DELETE FROM pending_challenges WHERE challenge_id = ? '
+                                'RETURNING challenge_id, user_id, issued_at', (challenge_id,)).fetchall()
+        if rows:
+            return Challenge(*rows[0])
+        if default is _MISSING:
+            raise KeyError(challenge_id)
+        return default
+
+    def __setitem__(self, challenge_id, challenge):
+        with self.store.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO pending_challenges VALUES (?, ?, ?)',
+                         (challenge_id, challenge.user_id, challenge.issued_at))
+
+    def __getitem__(self, challenge_id):
+        challenge = self.get(challenge_id)
+        if challenge is None:
+            raise KeyError(challenge_id)
+        return challenge
+
+    def __delitem__(self, challenge_id):
+        self.pop(challenge_id)
+
+    def __contains__(self, challenge_id):
+        return self.get(challenge_id) is not None
+
+    def __len__(self):
+        with self.store.lock:
+            return self.store.conn.execute('SELECT COUNT(*) FROM pending_challenges').fetchone()[0]
+
+    def expire(self, before):
+        # Rows issued before `before`, including ones left by workers that died.
+        with self.store.transaction() as conn:
+            return conn.execute('DELETE FROM pending_challenges WHERE issued_at < ?', (before,)).rowcount
+
+
+class SQLiteBackend:
+    """Challenges and sessions live only in SQLite, so any worker can serve any request."""
+
+    shared = True
+
+    def __init__(self, store):
+        self.challenges = SQLiteChallengeMap(store)
+        self.sessions = None  # read from the active_sessions table on every access
+
+    def sweep(self, now, ttl):
+        # (challenges, sessions) removed; expired sessions are left to the store.
+        return self.challenges.expire(now - ttl), 0
+
+
+class SharedMap:
+    """Fixed-capacity hash table in an mmap'd file, shared by processes on one host.
+
+    Linear probing with backward-shift deletion, so there are no tombstones
+    to slow lookups down over time. Every operation holds a flock on the
+    file (plus a thread lock, since flock does not exclude threads).
+    """
+
+    HEADER = struct.Struct('!4sIIII')  # magic, capacity, key_size, value_size, count
+    MAGIC = b'SDIL'
+
+    def __init__(self, path, capacity, value_size, encode, decode, key_size=64):
+        self.path = path
+        self.capacity = capacity
+        self.key_size = key_size
+        self.value_size = value_size
+        self.encode = encode
+        self.decode = decode
+        self.slot = struct.Struct(f'!BBH{key_size}s{value_size}s')  # used, key_len, value_len, key, value
+        self.size = self.HEADER.size + capacity * self.slot.size
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self.fd).st_size == 0:
+                os.ftruncate(self.fd, self.size)
+                header = self.HEADER.pack(self.MAGIC, capacity, key_size, value_size, 0)
+                os.pwrite(self.fd, header, 0)
+            elif os.fstat(self.fd).st_size != self.size:
+                raise ValueError(f"{path} was created with a different capacity or slot size")
+        self.map = mmap.mmap(self.fd, self.size)
+
+    @contextmanager
+    def _locked(self):
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _home(self, key):
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big') % self.capacity
+
+    def _offset(self, index):
+        return self.HEADER.size + index * self.slot.size
+
+    def _read(self, index):
+        used, key_len, value_len, key, value = self.slot.unpack_from(self.map, self._offset(index))
+        return used, key[:key_len], value[:value_len]
+
+    def _find(self, key):
+        index = self._home(key)
+        for _ in range(self.capacity):
+            used, slot_key, value = self._read(index)
+            if not used:
+                return index, None
+            if slot_key == key:
+                return index, value
+            index = (index + 1) % self.capacity
+        return None, None
+
+    def _count(self, delta):
+        count = self.HEADER.unpack_from(self.map)[4] + delta
+        struct.pack_into('!I', self.map, self.HEADER.size - 4, count)
+        return count
+
+    def _key(self, name):
+        key = name.encode()
+        if len(key) > self.key_size:
+            raise ValueError(f"Key too long for shared table: {name!r}")
+        return key
+
+    def get(self, key, default=None):
+        with self._locked():
+            _, value = self._find(self._key(key))
+        return default if value is None else self.decode(key, value)
+
+    def __setitem__(self, key, item):
+        raw_key, value = self._key(key), self.encode(item)
+        if len(value) > self.value_size:
+            raise ValueError(f"Value too large for shared table ({len(value)} > {self.value_size} bytes)")
+        with self._locked():
+            index, existing = self._find(raw_key)
+            if index is None:
+                raise SharedTableFull(f"Shared table {self.path} is full")
+            if existing is None:
+                self._count(1)
+            self.slot.pack_into(self.map, self._offset(index), 1, len(raw_key), len(value), raw_key, value)
+
+    def pop(self, key, default=_MISSING):
+        with self._locked():
+            index, value = self._find(self._key(key))
+            if value is not None:
+                self._delete(index)
+                self._count(-1)
+        if value is not None:
+            return self.decode(key, value)
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def _delete(self, hole):
+        # Backward-shift deletion: pull later members of the probe run into the hole.
+        self.slot.pack_into(self.map, self._offset(hole), 0, 0, 0, b'', b'')
+        index = (hole + 1) % self.capacity
+        while True:
+            used, key, value = self._read(index)
+            if not used:
+                break
+            home = self._home(key)
+            if (hole < index and not hole < home <= index) or (hole > index and index < home <= hole):
+                self.slot.pack_into(self.map, self._offset(hole), 1, len(key), len(value), key, value)
+                self.slot.pack_into(self.map, self._offset(index), 0, 0, 0, b'', b'')
+                hole = index
+            index = (index + 1) % self.capacity
+
+    def __getitem__(self, key):
+        item = self.get(key, _MISSING)
+        if item is _MISSING:
+            raise KeyError(key)
+        return item
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._locked():
+            return self.HEADER.unpack_from(self.map)[4]
+
+    def sweep(self, expired):
+        # Frees every slot whose decoded item satisfies expired(item) and
+        # returns how many; a full scan, so callers run it sparingly.
+        with self._locked():
+            keys = [key for used, key, value in map(self._read, range(self.capacity))
+                    if used and expired(self.decode(key.decode(), value))]
+            for key in keys:
+                index, _ = self._find(key)
+                self._delete(index)
+            self._count(-len(keys))
+        return len(keys)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+CHALLENGE_VALUE = struct.Struct('!d')        # issued_at, then user_id
+SESSION_VALUE = struct.Struct('!ddB')         # issued_at, expires_at, device_id length, then device_id + user_id
+
+
+def _encode_challenge(challenge):
+    return CHALLENGE_VALUE.pack(challenge.issued_at) + challenge.user_id.encode()
+
+
+def _decode_challenge(challenge_id, raw):
+    issued_at, = CHALLENGE_VALUE.unpack_from(raw)
+    return Challenge(challenge_id, raw[CHALLENGE_VALUE.size:].decode(), issued_at)
+
+
+def _encode_session(session):
+    device = session.device_id.encode()
+    return SESSION_VALUE.pack(session.issued_at, session.expires_at, len(device)) + device + session.user_id.encode()
+
+
+def _decode_session(token_id, raw):
+    issued_at, expires_at, device_len = SESSION_VALUE.unpack_from(raw)
+    rest = raw[SESSION_VALUE.size:]
+    return Session(token_id, rest[device_len:].decode(), rest[:device_len].decode(), issued_at, expires_at)
+
+
+class SharedSessions:
+    """SessionIndex interface over a SharedMap keyed by token_id.
+
+    The per-user and per-device indexes are the ones on the SQLite table the
+    server writes every session through to, so bulk revocation still only
+    touches that user's or device's k sessions.
+    """
+
+    def __init__(self, table, store):
+        self.table = table
+        self.store = store
+
+    def add(self, session):
+        self.table[session.token_id] = session
+
+    def get(self, token_id):
+        return self.table.get(token_id)
+
+    def _live(self, rows):
+        return [s for s in (self.table.get(row.token_id) for row in rows) if s is not None]
+
+    def for_user(self, user_id):
+        return self._live(self.store.get_user_sessions(user_id))
+
+    def pop(self, token_id):
+        return self.table.pop(token_id, None)
+
+    def pop_user(self, user_id):
+        return [s for s in (self.pop(row.token_id) for row in self.store.get_user_sessions(user_id)) if s]
+
+    def pop_device(self, device_id):
+        return [s for s in (self.pop(row.token_id) for row in self.store.get_device_sessions(device_id)) if s]
+
+    def __len__(self):
+        return len(self.table)
+
+
+class SharedMemoryBackend:
+    """Challenges and sessions in mmap'd tables next to the DB; sessions are still written through to SQLite."""
+
+    shared = True
+
+    def __init__(self, store, path_prefix=None, capacity=65536):
+        path_prefix = path_prefix or store.db_path
+        self.challenges = SharedMap(path_prefix + '.challenges', capacity, 72, _encode_challenge, _decode_challenge)
+        self.sessions = SharedSessions(
+            SharedMap(path_prefix + '.sessions', capacity, 160, _encode_session, _decode_session, key_size=32),
+            store)
+
+    def sweep(self, now, ttl):
+        # Challenges and sessions of every worker, not just this one's wheel.
+        return (self.challenges.sweep(lambda challenge: challenge.issued_at < now - ttl),
+                self.sessions.table.sweep(lambda session: session.expires_at < now))
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+    'shm': SharedMemoryBackend,
+}
+
+
+def make_backend(name, shm_capacity=65536, max_challenges=None, shards=16):
+    # max_challenges bounds the memory backend; the shm tables are bounded
+    # by their capacity and SQLite rows by the expiry sweep.
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown state backend: {name}")
+    if name == 'shm':
+        return lambda store: SharedMemoryBackend(store, capacity=shm_capacity)
+    if name == 'memory':
+        return lambda store: MemoryBackend(store, max_challenges, shards)
+    return BACKENDS[name]
@@ -0,0 +1,142 @@
+"""Bulk import/export of user_devices as NDJSON or CSV.
+
+    python bulk.py import devices.ndjson --db sdi_l.db
+    python bulk.py export devices.csv --db sdi_l.db
+
+Both directions stream: records are read through a generator, validated and
+inserted a chunk at a time with executemany, and exported a page at a time,
+so memory stays bounded by the chunk size rather than the file size. A
+running eager server only sees rows imported this way after a restart; use
+Server_Srav.import_devices to import into a live server.
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import secrets
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import SQLiteStore
+
+P = 2**256 - 189
+FIELDS = ('user_id', 'public_ver_key', 'device_id')
+MAX_ERRORS = 100
+
+
+def detect_format(path):
+    return 'csv' if path.endswith('.csv') else 'ndjson'
+
+
+def read_records(stream, fmt='ndjson'):
+    # Yields (line_number, user_id, public_ver_key, device_id) without parsing
+    # the key; device_id is optional, so an export can be imported elsewhere.
+    if fmt == 'csv':
+        for line_no, row in enumerate(csv.reader(stream), 1):
+            if not row or (line_no == 1 and tuple(row) == FIELDS[:len(row)]):
+                continue
+            row += [None] * (3 - len(row))
+            yield line_no, row[0], row[1], row[2] or None
+    else:
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, None, None, None
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, None, None
+                continue
+            yield line_no, record.get('user_id'), record.get('public_ver_key'), record.get('device_id')
+
+
+def validate_chunk(records, modulus=P):
+    # Splits a chunk into (user_id, device_id, key) rows and (line_number, error) pairs.
+    rows, errors = [], []
+    for line_no, user_id, key, device_id in records:
+        if not isinstance(user_id, str) or not user_id:
+            errors.append((line_no, "Missing user_id"))
+            continue
+        try:
+            value = int(key)
+        except (TypeError, ValueError):
+            errors.append((line_no, f"Invalid public_ver_key for {user_id}"))
+            continue
+        if not 0 < value < modulus:
+            errors.append((line_no, f"public_ver_key out of range for {user_id}"))
+            continue
+        rows.append((user_id, device_id or secrets.token_hex(8), value))
+    return rows, errors
+
+
+def import_devices(store, records, chunk_size=50000, modulus=P, on_rows=None):
+    stats = {'imported': 0, 'duplicates': 0, 'rejected': 0, 'errors': []}
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return stats
+        rows, errors = validate_chunk(chunk, modulus)
+        inserted = store.add_devices(rows)
+        if on_rows is not None:
+            on_rows(rows)
+        stats['imported'] += inserted
+        stats['duplicates'] += len(rows) - inserted
+        stats['rejected'] += len(errors)
+        stats['errors'].extend(errors[:MAX_ERRORS - len(stats['errors'])])
+
+
+def export_devices(store, stream, fmt='ndjson', page_size=50000):
+    count = 0
+    writer = csv.writer(stream) if fmt == 'csv' else None
+    if writer is not None:
+        writer.writerow(FIELDS)
+    for user_id, device_id, key in store.iter_devices(page_size):
+        if writer is not None:
+            writer.writerow((user_id, str(key), device_id))
+        else:
+            stream.write(json.dumps({'user_id': user_id, 'public_ver_key': str(key), 'device_id': device_id}) + '\n')
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export of registered devices.")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path', help="NDJSON or CSV file, '-' for stdin/stdout")
+    parser.add_argument('--db', default=os.environ.get('SDIL_DB_PATH', 'sdi_l.db'))
+    parser.add_argument('--format', choices=('ndjson', 'csv'))
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args(argv)
+    fmt = args.format or detect_format(args.path)
+
+    store = SQLiteStore(args.db)
+    start = time.perf_counter()
+    try:
+        if args.command == 'import':
+            with (contextlib.nullcontext(sys.stdin) if args.path == '-' else open(args.path, newline='')) as stream:
+                stats = import_devices(store, read_records(stream, fmt), args.chunk_size)
+            for line_no, error in stats['errors']:
+                print(f"line {line_no}: {error}", file=sys.stderr)
+            count = stats['imported']
+            print(f"Imported {count} devices, skipped {stats['duplicates']} duplicates, "
+                  f"rejected {stats['rejected']}", file=sys.stderr)
+        else:
+            with (contextlib.nullcontext(sys.stdout) if args.path == '-'
+                  else open(args.path, 'w', newline='')) as stream:
+                count = export_devices(store, stream, fmt, args.chunk_size)
+            print(f"Exported {count} devices", file=sys.stderr)
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.2f}s, {count / elapsed if elapsed else 0:.0f} rows/s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
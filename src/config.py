@@ -0,0 +1,41 @@
+import os
+import secrets
+
+DB_PATH = os.environ.get('SDIL_DB_PATH', 'sdi_l.db')
+LAZY_LOAD = os.environ.get('SDIL_LAZY_LOAD', '0') == '1'
+DEVICE_CACHE_SIZE = int(os.environ.get('SDIL_DEVICE_CACHE_SIZE', '100000'))
+# Unset means one crypto worker process per core; 0 runs exponentiations inline.
+CRYPTO_WORKERS = int(os.environ['SDIL_CRYPTO_WORKERS']) if 'SDIL_CRYPTO_WORKERS' in os.environ else None
+BATCH_MAX_ITEMS = int(os.environ.get('SDIL_BATCH_MAX_ITEMS', '1000'))
+EXPIRY_INTERVAL = float(os.environ.get('SDIL_EXPIRY_INTERVAL', '1.0'))
+# 'signed' issues HMAC-signed session tokens that validate without a lookup.
+SESSION_TOKENS = os.environ.get('SDIL_SESSION_TOKENS', 'stateful')
+# Share this across workers; the random fallback invalidates tokens on restart.
+SESSION_SECRET = os.environ.get('SDIL_SESSION_SECRET') or secrets.token_hex(32)
+# memory: one worker only; sqlite or shm: state shared by workers on this host.
+STATE_BACKEND = os.environ.get('SDIL_STATE_BACKEND', 'memory')
+SHM_CAPACITY = int(os.environ.get('SDIL_SHM_CAPACITY', '65536'))
+# 0 turns instrumentation and the /metrics route off.
+METRICS = os.environ.get('SDIL_METRICS', '1') != '0'
+# Pending challenges kept by the memory backend; the oldest is evicted past this.
+MAX_PENDING_CHALLENGES = int(os.environ.get('SDIL_MAX_PENDING_CHALLENGES', '100000'))
+# Challenges per second each user may request, after a burst; 0 disables the limit.
+CHALLENGE_RATE = float(os.environ.get('SDIL_CHALLENGE_RATE', '1.0'))
+CHALLENGE_BURST = int(os.environ.get('SDIL_CHALLENGE_BURST', '10'))
+# Level and mode (async, buffered or direct) of the 'sdil' loggers; see logs.configure.
+LOG_LEVEL = os.environ.get('SDIL_LOG_LEVEL', 'WARNING').upper()
+LOG_MODE = os.environ.get('SDIL_LOG_MODE', 'async')
+# Shards (each with its own lock) of the in-memory session and device stores.
+SHARDS = int(os.environ.get('SDIL_SHARDS', '16'))
+# Serialized GET /devices responses kept per (user, page).
+DEVICE_LISTING_CACHE_SIZE = int(os.environ.get('SDIL_DEVICE_LISTING_CACHE_SIZE', '10000'))
+# sqlite, or journal: in-memory state with an append-only journal and periodic
+# snapshots (files beside DB_PATH); memory state backend only. The journal
+# keeps all devices and sessions resident, so it implies SDIL_LAZY_LOAD: the
+# server reads them from the store (plus an LRU of DEVICE_CACHE_SIZE users)
+# instead of holding a second copy. Pending challenges are still held twice,
+# but only for their 60 s TTL.
+PERSISTENCE = os.environ.get('SDIL_PERSISTENCE', 'sqlite')
+# 0 only write()s each journal commit: safe against a crash, not a power loss.
+JOURNAL_FSYNC = os.environ.get('SDIL_JOURNAL_FSYNC', '1') != '0'
+SNAPSHOT_EVERY = int(os.environ.get('SDIL_SNAPSHOT_EVERY', '100000'))
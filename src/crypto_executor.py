@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+class CryptoExecutor:
+    """Runs modular exponentiations off the request thread in a process pool.
+
+    workers=0 keeps everything inline, which is what the server and wallet
+    do when no executor is configured. Queue depth and submit-to-done
+    latency are tracked either way.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def start(self):
+        # Fork the workers up front: forking lazily from a busy multi-threaded
+        # server can copy a held lock into a child and hang it.
+        if self.workers:
+            self._get_pool().submit(int).result()
+
+    def _record(self, started, count=1):
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.completed += count
+            self.total_latency += latency * count
+            self.max_latency = max(self.max_latency, latency)
+
+    def submit(self, fn, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+        future = Future()
+
+        def finish(result=None, error=None):
+            # Record before resolving so stats are current once result() returns.
+            self._record(started)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        if not self.workers:
+            try:
+                finish(fn(*args))
+            except Exception as e:
+                finish(error=e)
+            return future
+        self._get_pool().submit(fn, *args).add_done_callback(
+            lambda done: finish(error=done.exception()) if done.exception() else finish(done.result()))
+        return future
+
+    def map(self, fn, *iterables):
+        calls = list(zip(*iterables))
+        if not self.workers or len(calls) <= 1:
+            return [self.submit(fn, *args).result() for args in calls]
+        started = time.perf_counter()
+        with self._lock:
+            self.submitted += len(calls)
+        chunksize = max(1, len(calls) // (self.workers * 4))
+        try:
+            return list(self._get_pool().map(fn, *zip(*calls), chunksize=chunksize))
+        finally:
+            self._record(started, len(calls))
+
+    def pow(self, base, exponent, modulus):
+        return self.submit(pow, base, exponent, modulus).result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'queue_depth': self.submitted - self.completed,
+                'latency_ms_avg': self.total_latency / self.completed * 1000 if self.completed else 0.0,
+                'latency_ms_max': self.max_latency * 1000,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
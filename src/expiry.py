@@ -0,0 +1,42 @@
+import math
+import threading
+import time
+
+
+class ExpiryWheel:
+    """Timing wheel with one bucket per `resolution` seconds of deadline.
+
+    schedule() is O(1); tick() hands back every key whose bucket has come
+    due, so each entry is touched once when it expires. Entries are never
+    cancelled: the owner re-checks the real deadline of each returned key
+    and ignores ones that were consumed or replaced in the meantime.
+    """
+
+    def __init__(self, resolution=1.0, now=None):
+        self.resolution = resolution
+        self.buckets = {}
+        self.next_slot = math.floor((time.time() if now is None else now) / resolution)
+        self.lock = threading.Lock()
+
+    def schedule(self, key, deadline):
+        with self.lock:
+            slot = max(math.ceil(deadline / self.resolution), self.next_slot)
+            self.buckets.setdefault(slot, []).append(key)
+
+    def tick(self, now=None):
+        end = math.floor((time.time() if now is None else now) / self.resolution)
+        due = []
+        with self.lock:
+            if end - self.next_slot > len(self.buckets):
+                # Long gap since the last tick: walk the occupied buckets only.
+                slots = sorted(slot for slot in self.buckets if slot <= end)
+            else:
+                slots = range(self.next_slot, end + 1)
+            for slot in slots:
+                due.extend(self.buckets.pop(slot, ()))
+            self.next_slot = max(self.next_slot, end + 1)
+        return due
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(keys) for keys in self.buckets.values())
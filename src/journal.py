@@ -0,0 +1,689 @@
+"""Snapshot + append-only journal persistence, an alternative to SQLiteStore.
+
+State is held in memory, and every change is appended to a journal as a
+CRC-checked record. Writers that arrive while a commit is in flight wait and
+share the next write + fsync (group commit). Once snapshot_every records have
+accumulated, a background thread switches to a new journal file. It then
+writes the state as of the switch to a compact columnar snapshot and deletes
+the journals the snapshot covers.
+
+Startup maps the snapshot and replays only the journals written since. Restart
+time therefore follows the snapshot size, not the length of the history. A
+record torn by a crash mid-write ends the last journal, and it is cut off there.
+
+Files: <path>.snapshot and <path>.journal.<generation>. If neither exists yet
+but <path> is a SQLite DB, its state is imported into the first snapshot.
+"""
+import array
+import gc
+import heapq
+import itertools
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from operator import attrgetter, itemgetter
+
+from records import Challenge, PendingChallenges, Session, SessionIndex
+from storage import KEY_SIZE, TOKEN_SIZE, SQLiteStore
+
+log = logging.getLogger('sdil.journal')
+
+RECORD = struct.Struct('!II')  # payload length, crc32 of the payload
+LENGTH = struct.Struct('!H')
+DOUBLE = struct.Struct('!d')
+SNAPSHOT = struct.Struct('<8sQ')  # magic, first journal generation not covered
+COUNT = struct.Struct('<Q')
+CRC = struct.Struct('<I')
+MAGIC = b'SDILSNP1'
+
+(DEVICE_ADD, USER_DELETE, SESSION_PUT, SESSION_DELETE, USER_SESSIONS_DELETE, DEVICE_SESSIONS_DELETE,
+ REVOCATION_PUT, REVOCATION_DELETE, CHALLENGE_PUT, CHALLENGE_DELETE) = range(1, 11)
+
+# Payload fields per record kind: s UTF-8 string, k key, t token id, d float.
+FIELDS = {
+    DEVICE_ADD: 'ssk', USER_DELETE: 's',
+    SESSION_PUT: 'tssdd', SESSION_DELETE: 't', USER_SESSIONS_DELETE: 's', DEVICE_SESSIONS_DELETE: 's',
+    REVOCATION_PUT: 'sd', REVOCATION_DELETE: 's',
+    CHALLENGE_PUT: 'ssd', CHALLENGE_DELETE: 's',
+}
+
+
+def encode_record(kind, *values):
+    parts = [bytes((kind,))]
+    for code, value in zip(FIELDS[kind], values):
+        if code == 's':
+            raw = value.encode()
+            parts.append(LENGTH.pack(len(raw)))
+            parts.append(raw)
+        elif code == 'd':
+            parts.append(DOUBLE.pack(value))
+        elif code == 'k':
+            parts.append(value.to_bytes(KEY_SIZE, 'big'))
+        else:
+            parts.append(bytes.fromhex(value))
+    payload = b''.join(parts)
+    return RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data):
+    # Yields (end_offset, kind, values) per record, stopping at the first one
+    # that is torn or fails its checksum.
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        length, crc = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        payload = data[start:start + length]
+        if not length or len(payload) < length or zlib.crc32(payload) != crc or payload[0] not in FIELDS:
+            return
+        values = []
+        pos = 1
+        for code in FIELDS[payload[0]]:
+            if code == 's':
+                size, = LENGTH.unpack_from(payload, pos)
+                values.append(payload[pos + 2:pos + 2 + size].decode())
+                pos += 2 + size
+            elif code == 'd':
+                values.append(DOUBLE.unpack_from(payload, pos)[0])
+                pos += DOUBLE.size
+            elif code == 'k':
+                values.append(int.from_bytes(payload[pos:pos + KEY_SIZE], 'big'))
+                pos += KEY_SIZE
+            else:
+                values.append(payload[pos:pos + TOKEN_SIZE].hex())
+                pos += TOKEN_SIZE
+        offset = start + length
+        yield offset, payload[0], values
+
+
+def _little_endian(column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _strings(values):
+    raw = [value.encode() for value in values]
+    return [_little_endian(array.array('I', map(len, raw))).tobytes(), b''.join(raw)]
+
+
+def _doubles(values):
+    return _little_endian(array.array('d', values)).tobytes()
+
+
+class _Columns:
+    """Sequential reader over a mapped snapshot."""
+
+    def __init__(self, buffer, offset):
+        self.buffer = buffer
+        self.offset = offset
+
+    def take(self, size):
+        chunk = self.buffer[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def count(self):
+        return COUNT.unpack(self.take(COUNT.size))[0]
+
+    def array(self, typecode, n):
+        column = array.array(typecode)
+        column.frombytes(self.take(n * column.itemsize))
+        return _little_endian(column)
+
+    def strings(self, n):
+        lengths = self.array('I', n)
+        blob = self.take(sum(lengths))
+        bounds = list(itertools.accumulate(lengths, initial=0))
+        # Ids are almost always ASCII: decode once and slice the str.
+        text = blob.decode('ascii') if blob.isascii() else None
+        if text is not None:
+            return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+        return [blob[a:b].decode() for a, b in zip(bounds, bounds[1:])]
+
+    def keys(self, n):
+        blob = self.take(n * KEY_SIZE)
+        return [int.from_bytes(blob[i:i + KEY_SIZE], 'big') for i in range(0, len(blob), KEY_SIZE)]
+
+    def tokens(self, n):
+        text = self.take(n * TOKEN_SIZE).hex()
+        width = 2 * TOKEN_SIZE
+        return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+def _grouped(keys, token_ids):
+    # {key: set of token ids}, taking runs of equal keys a set at a time.
+    index = {}
+    for key, run in itertools.groupby(zip(keys, token_ids), itemgetter(0)):
+        run = set(map(itemgetter(1), run))
+        known = index.get(key)
+        if known is None:
+            index[key] = run
+        else:
+            known |= run
+    return index
+
+
+def write_snapshot(path, generation, devices, sessions, revocations, challenges):
+    # devices: {user_id: ((device_id, key), ...)}; sessions, challenges: lists;
+    # revocations: {subject: revoked_at}. Written beside the target and
+    # renamed over it, so a crash leaves either the old or the new snapshot.
+    # Sessions are ordered by user and device, so loading builds those
+    # indexes a run at a time.
+    sessions = sorted(sessions, key=attrgetter('user_id', 'device_id'))
+    rows = [(user_id, device_id, key) for user_id, user_devices in devices.items()
+            for device_id, key in user_devices]
+    parts = [SNAPSHOT.pack(MAGIC, generation), COUNT.pack(len(rows))]
+    parts += _strings(row[0] for row in rows)
+    parts += _strings(row[1] for row in rows)
+    parts.append(b''.join(row[2].to_bytes(KEY_SIZE, 'big') for row in rows))
+    del rows
+
+    parts.append(COUNT.pack(len(sessions)))
+    parts.append(bytes.fromhex(''.join(session.token_id for session in sessions)))
+    parts += _strings(session.user_id for session in sessions)
+    parts += _strings(session.device_id for session in sessions)
+    parts.append(_doubles(session.issued_at for session in sessions))
+    parts.append(_doubles(session.expires_at for session in sessions))
+
+    parts.append(COUNT.pack(len(revocations)))
+    parts += _strings(revocations)
+    parts.append(_doubles(revocations.values()))
+
+    parts.append(COUNT.pack(len(challenges)))
+    parts += _strings(challenge.challenge_id for challenge in challenges)
+    parts += _strings(challenge.user_id for challenge in challenges)
+    parts.append(_doubles(challenge.issued_at for challenge in challenges))
+
+    crc = 0
+    for part in parts:
+        crc = zlib.crc32(part, crc)
+    parts.append(CRC.pack(crc))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.writelines(parts)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def _fsync_dir(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JournalStore:
+    """SQLiteStore's interface over in-memory state, a journal and snapshots.
+
+    fsync=False only write()s each group, which survives a process crash but
+    not a power loss. Changes made in transaction() share one commit and
+    cannot be rolled back.
+    """
+
+    def __init__(self, path="sdi_l.db", metrics=None, fsync=True, snapshot_every=100000, flush_interval=0.05):
+        self.path = path
+        self.db_path = path
+        self.metrics = metrics
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()  # state, buffer and the journal fd
+        self.commit_cond = threading.Condition()  # taken before self.lock, never after
+        self.snapshot_lock = threading.Lock()
+        self._local = threading.local()
+
+        self.devices = {}  # user_id -> ((device_id, key), ...), replaced on write
+        self.sessions = SessionIndex()
+        self.revocations = {}
+        self.challenges = {}
+        self._expiring = None  # (expires_at, token_id) heap, built on first use
+
+        self.buffer = []
+        self.appended = 0  # records appended since startup
+        self.durable = 0  # of which written (and fsynced) to the journal
+        self.committing = False
+        self.since_snapshot = 0
+        self.snapshots = 0
+
+        self.generation = self._recover()
+        self.fd = self._open_journal(self.generation)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(flush_interval,), name='sdil-journal', daemon=True)
+        self._thread.start()
+
+    # Recovery
+
+    def _journal_path(self, generation):
+        return f'{self.path}.journal.{generation}'
+
+    def _journal_generations(self):
+        directory, prefix = os.path.split(os.path.abspath(self.path))
+        prefix += '.journal.'
+        return sorted(int(name[len(prefix):]) for name in os.listdir(directory)
+                      if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+    def _open_journal(self, generation):
+        return os.open(self._journal_path(generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def _recover(self):
+        generation = 0
+        journals = self._journal_generations()
+        if os.path.exists(self.path + '.snapshot'):
+            generation = self._load_snapshot(self.path + '.snapshot')
+        elif not journals and os.path.exists(self.path):
+            self._import_sqlite()
+        for journal in journals:
+            if journal < generation:
+                # Covered by the snapshot; left over from a crash before it was deleted.
+                os.remove(self._journal_path(journal))
+                continue
+            self._replay(journal)
+            generation = journal
+        return generation
+
+    def _import_sqlite(self):
+        # First start on a path that still holds a SQLite DB: take its state
+        # over once, as the snapshot the journals will follow. The DB is
+        # not read again (or changed beyond SQLiteStore's own migration).
+        store = SQLiteStore(self.path)
+        try:
+            devices = {}
+            for user_id, device_id, key in store.load_devices():
+                devices.setdefault(user_id, []).append((device_id, key))
+            self.devices = {user_id: tuple(user_devices) for user_id, user_devices in devices.items()}
+            for session in store.load_sessions():
+                self.sessions.add(session)
+            self.revocations = dict(store.load_revocations(0))
+        finally:
+            store.close()
+        write_snapshot(self.path + '.snapshot', 0, self.devices, list(self.sessions.by_token.values()),
+                       self.revocations, [])
+        log.info("Imported %d devices and %d sessions from SQLite DB %s", sum(map(len, self.devices.values())),
+                 len(self.sessions.by_token), self.path)
+
+    def _load_snapshot(self, path):
+        # Nothing loaded here forms a cycle, so the collector's passes over
+        # millions of new objects would find nothing; hold them off.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._read_snapshot(path)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _read_snapshot(self, path):
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, generation = SNAPSHOT.unpack_from(buffer)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a snapshot")
+            with memoryview(buffer) as view:
+                body = view[:-CRC.size]
+                crc = zlib.crc32(body)
+                body.release()
+            if crc != CRC.unpack_from(buffer, len(buffer) - CRC.size)[0]:
+                raise ValueError(f"Snapshot {path} is corrupt")
+            columns = _Columns(buffer, SNAPSHOT.size)
+
+            n = columns.count()
+            devices = {}
+            for user_id, device_id, key in zip(columns.strings(n), columns.strings(n), columns.keys(n)):
+                devices.setdefault(user_id, []).append((device_id, key))
+            self.devices = {user_id: tuple(user_devices) for user_id, user_devices in devices.items()}
+            del devices
+
+            n = columns.count()
+            token_ids, user_ids, device_ids = columns.tokens(n), columns.strings(n), columns.strings(n)
+            sessions = map(Session, token_ids, user_ids, device_ids, columns.array('d', n), columns.array('d', n))
+            self.sessions.by_token = dict(zip(token_ids, sessions))
+            self.sessions.by_user = _grouped(user_ids, token_ids)
+            self.sessions.by_device = _grouped(device_ids, token_ids)
+            del token_ids, user_ids, device_ids
+
+            n = columns.count()
+            self.revocations = dict(zip(columns.strings(n), columns.array('d', n)))
+
+            n = columns.count()
+            for challenge in map(Challenge, columns.strings(n), columns.strings(n), columns.array('d', n)):
+                self.challenges[challenge.challenge_id] = challenge
+        return generation
+
+    def _replay(self, generation):
+        path = self._journal_path(generation)
+        with open(path, 'rb') as f:
+            data = f.read()
+        end = 0
+        for end, kind, values in decode_records(data):
+            self._apply(kind, values)
+            self.since_snapshot += 1
+        if end < len(data):
+            log.warning("Truncating %s at byte %d of %d: torn or corrupt record", path, end, len(data))
+            os.truncate(path, end)
+
+    # Applying changes
+
+    def _apply(self, kind, values):
+        if kind == DEVICE_ADD:
+            user_id, device_id, key = values
+            user_devices = self.devices.get(user_id, ())
+            if any(known == device_id for known, _ in user_devices):
+                return False
+            self.devices[user_id] = user_devices + ((device_id, key),)
+            return True
+        if kind == USER_DELETE:
+            self.devices.pop(values[0], None)
+            return self.sessions.pop_user(values[0])
+        if kind == SESSION_PUT:
+            session = Session(*values)
+            self.sessions.pop(session.token_id)
+            self.sessions.add(session)
+            if self._expiring is not None:
+                heapq.heappush(self._expiring, (session.expires_at, session.token_id))
+            return session
+        if kind == SESSION_DELETE:
+            return self.sessions.pop(values[0])
+        if kind == USER_SESSIONS_DELETE:
+            return self.sessions.pop_user(values[0])
+        if kind == DEVICE_SESSIONS_DELETE:
+            return self.sessions.pop_device(values[0])
+        if kind == REVOCATION_PUT:
+            self.revocations[values[0]] = values[1]
+        elif kind == REVOCATION_DELETE:
+            self.revocations.pop(values[0], None)
+        elif kind == CHALLENGE_PUT:
+            self.challenges[values[0]] = Challenge(*values)
+        else:
+            self.challenges.pop(values[0], None)
+
+    def _change(self, kind, *values, wait=True):
+        # Applies and appends under the lock, so the journal order is the
+        # order changes were made in; waits outside it, so others can join
+        # the group. wait=False leaves the record to the next commit, at most
+        # flush_interval away.
+        record = encode_record(kind, *values)
+        with self.lock:
+            result = self._apply(kind, values)
+            self.buffer.append(record)
+            self.appended += 1
+            self.since_snapshot += 1
+            seq = self.appended
+        if wait:
+            if getattr(self._local, 'depth', 0):
+                self._local.seq = seq
+            else:
+                self._wait(seq)
+        return result
+
+    # Group commit
+
+    @contextmanager
+    def transaction(self):
+        # Changes inside share one commit at the end of the outermost block.
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        try:
+            yield self
+        finally:
+            local.depth = depth
+            seq, local.seq = getattr(local, 'seq', 0), 0
+            if depth:
+                local.seq = seq
+            elif seq:
+                self._wait(seq)
+
+    def _wait(self, seq):
+        with self.commit_cond:
+            while self.durable < seq:
+                if self.committing:
+                    self.commit_cond.wait()
+                else:
+                    self._lead_commit()
+
+    def _lead_commit(self):
+        # Holding commit_cond: write everything appended so far as one group,
+        # letting later writers queue up for the next one meanwhile.
+        self.committing = True
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+            upto = self.appended
+            fd = self.fd
+        self.commit_cond.release()
+        try:
+            self._write(fd, batch)
+        except BaseException:
+            with self.lock:
+                self.buffer[:0] = batch
+            raise
+        finally:
+            self.commit_cond.acquire()
+            self.committing = False
+            self.commit_cond.notify_all()
+        self.durable = upto
+
+    def _write(self, fd, batch):
+        if not batch:
+            return
+        start = time.perf_counter() if self.metrics is not None else None
+        view = memoryview(b''.join(batch))
+        while view:
+            view = view[os.write(fd, view):]
+        if self.fsync:
+            os.fsync(fd)
+        if start is not None:
+            self.metrics.observe('sdil_journal_commit_seconds', time.perf_counter() - start)
+            self.metrics.inc('sdil_journal_records_total', len(batch))
+
+    def flush(self):
+        with self.lock:
+            seq = self.appended
+        self._wait(seq)
+
+    # Snapshots
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            if self.buffer:
+                self.flush()
+            if self.snapshot_every and self.since_snapshot >= self.snapshot_every:
+                self.snapshot()
+
+    def snapshot(self):
+        # Switches to a new journal under both locks, then writes the state
+        # as of the switch without holding either. Sessions are immutable and
+        # device tuples are replaced rather than changed, so shallow copies
+        # are enough.
+        with self.snapshot_lock:
+            with self.commit_cond:
+                while self.committing:
+                    self.commit_cond.wait()
+                with self.lock:
+                    batch, self.buffer = self.buffer, []
+                    self._write(self.fd, batch)
+                    if not self.fsync:
+                        os.fsync(self.fd)
+                    os.close(self.fd)
+                    self.generation += 1
+                    self.fd = self._open_journal(self.generation)
+                    self.durable = self.appended
+                    self.since_snapshot = 0
+                    generation = self.generation
+                    state = (dict(self.devices), list(self.sessions.by_token.values()),
+                             dict(self.revocations), list(self.challenges.values()))
+                self.commit_cond.notify_all()
+            _fsync_dir(self.path)
+            start = time.perf_counter()
+            write_snapshot(self.path + '.snapshot', generation, *state)
+            for journal in self._journal_generations():
+                if journal < generation:
+                    os.remove(self._journal_path(journal))
+            self.snapshots += 1
+            elapsed = time.perf_counter() - start
+            if self.metrics is not None:
+                self.metrics.observe('sdil_snapshot_seconds', elapsed)
+            log.info("Wrote snapshot %d of %d sessions in %.2fs", generation, len(state[1]), elapsed)
+
+    def stats(self):
+        return {'generation': self.generation, 'appended': self.appended, 'durable': self.durable,
+                'since_snapshot': self.since_snapshot, 'snapshots': self.snapshots}
+
+    # SQLiteStore interface
+
+    def load_devices(self):
+        for user_id, user_devices in list(self.devices.items()):
+            for device_id, key in user_devices:
+                yield user_id, device_id, key
+
+    def iter_devices(self, page_size=50000):
+        return self.load_devices()
+
+    def load_sessions(self):
+        with self.lock:
+            return list(self.sessions.by_token.values())
+
+    def get_devices(self, user_id):
+        return [{'device_id': device_id, 'public_ver_key': key} for device_id, key in self.devices.get(user_id, ())]
+
+    def get_session(self, token_id):
+        return self.sessions.get(token_id)
+
+    def get_user_sessions(self, user_id):
+        with self.lock:
+            return self.sessions.for_user(user_id)
+
+    def get_device_sessions(self, device_id):
+        with self.lock:
+            return [self.sessions.by_token[token_id] for token_id in self.sessions.by_device.get(device_id, ())]
+
+    def add_device(self, user_id, device_id, public_ver_key):
+        self._change(DEVICE_ADD, user_id, device_id, public_ver_key)
+
+    def add_devices(self, rows):
+        # Existing (user_id, device_id) pairs are skipped; returns how many were inserted.
+        with self.transaction():
+            return sum(self._change(DEVICE_ADD, *row) for row in rows)
+
+    def delete_user(self, user_id):
+        self._change(USER_DELETE, user_id)
+
+    def put_session(self, session):
+        self._change(SESSION_PUT, session.token_id, session.user_id, session.device_id,
+                     session.issued_at, session.expires_at)
+
+    def delete_session(self, token_id):
+        if self.sessions.get(token_id) is None:
+            return None
+        return self._change(SESSION_DELETE, token_id)
+
+    def delete_user_sessions(self, user_id):
+        return self._change(USER_SESSIONS_DELETE, user_id)
+
+    def delete_device_sessions(self, device_id):
+        return self._change(DEVICE_SESSIONS_DELETE, device_id)
+
+    def delete_sessions(self, token_ids):
+        # Expired sessions: losing these deletes in a crash only means the
+        # expiry sweep finds them again.
+        for token_id in token_ids:
+            if self.sessions.get(token_id) is not None:
+                self._change(SESSION_DELETE, token_id, wait=False)
+
+    def delete_expired_sessions(self, now):
+        with self.lock:
+            if self._expiring is None:
+                self._expiring = [(session.expires_at, token_id)
+                                  for token_id, session in self.sessions.by_token.items()]
+                heapq.heapify(self._expiring)
+            expired = []
+            while self._expiring and self._expiring[0][0] < now:
+                expires_at, token_id = heapq.heappop(self._expiring)
+                session = self.sessions.get(token_id)
+                # Entries are left behind by deletes and re-puts; skip those.
+                if session is not None and session.expires_at == expires_at:
+                    expired.append(token_id)
+            self.delete_sessions(expired)
+        return len(expired)
+
+    def count_sessions(self):
+        return len(self.sessions)
+
+    def load_revocations(self, since):
+        with self.lock:
+            return [(subject, revoked_at) for subject, revoked_at in self.revocations.items() if revoked_at >= since]
+
+    def put_revocation(self, subject, revoked_at):
+        self._change(REVOCATION_PUT, subject, revoked_at)
+
+    def delete_revocations(self, subjects):
+        for subject in subjects:
+            self._change(REVOCATION_DELETE, subject, wait=False)
+
+    def pending_challenges(self, max_size=None):
+        return JournaledChallenges(self, max_size)
+
+    def put_challenge(self, challenge):
+        # Challenges live for a TTL of seconds and are cheap to reissue, so
+        # they ride along with the next commit instead of forcing one.
+        self._change(CHALLENGE_PUT, challenge.challenge_id, challenge.user_id, challenge.issued_at, wait=False)
+
+    def delete_challenge(self, challenge_id, wait=True):
+        # A consumed challenge must be gone from the journal before the
+        # token it bought is handed out, or a crash would restore it for a
+        # replay; evictions can ride along with the next commit.
+        self._change(CHALLENGE_DELETE, challenge_id, wait=wait)
+
+    def close(self, snapshot=True):
+        # A snapshot on close means the next start replays no journal at all.
+        self._stop.set()
+        self._thread.join()
+        if snapshot and self.since_snapshot:
+            self.snapshot()
+        self.flush()
+        os.close(self.fd)
+
+
+class JournaledChallenges(PendingChallenges):
+    """PendingChallenges whose changes go to a JournalStore, so they survive a restart."""
+
+    def __init__(self, store, max_size=None):
+        super().__init__(max_size)
+        self.store = store
+        for challenge in sorted(store.challenges.values(), key=lambda challenge: challenge.issued_at):
+            super().__setitem__(challenge.challenge_id, challenge)
+
+    def pop(self, challenge_id, *default):
+        challenge = self.entries.pop(challenge_id, None)
+        if challenge is None:
+            if default:
+                return default[0]
+            raise KeyError(challenge_id)
+        self.store.delete_challenge(challenge_id)
+        return challenge
+
+    def __setitem__(self, challenge_id, challenge):
+        self.store.put_challenge(challenge)
+        super().__setitem__(challenge_id, challenge)
+
+    def __delitem__(self, challenge_id):
+        self.pop(challenge_id)
+
+    def evicted(self, challenge):
+        self.store.delete_challenge(challenge.challenge_id, wait=False)
+
+
+def make_store(name, fsync=True, snapshot_every=100000):
+    # Store factory for Server_Srav(store=...).
+    if name == 'sqlite':
+        return SQLiteStore
+    if name == 'journal':
+        return lambda path, metrics=None: JournalStore(path, metrics, fsync, snapshot_every)
+    raise ValueError(f"Unknown persistence engine: {name}")
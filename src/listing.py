@@ -0,0 +1,96 @@
+import hashlib
+import json
+import secrets
+import threading
+from collections import OrderedDict
+
+MAX_PAGE = 10000
+
+
+def parse_page(args):
+    # offset/limit query parameters; without a limit the whole list is returned.
+    try:
+        offset = int(args.get('offset', 0))
+        limit = int(args['limit']) if args.get('limit') is not None else None
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    if offset < 0 or (limit is not None and not 0 < limit <= MAX_PAGE):
+        raise ValueError(f"offset must be >= 0 and limit between 1 and {MAX_PAGE}")
+    return offset, limit
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+class DeviceListings:
+    """Serialized GET /devices/<user_id> bodies, reused while the user's devices are unchanged.
+
+    The ETag comes from Server_Srav.device_version plus a per-process epoch
+    (versions restart with the process), so a matching If-None-Match is
+    answered without reading the device list at all. With a shared backend
+    other workers register devices without bumping this process's versions,
+    so nothing is cached and the ETag is a hash of the body instead.
+    """
+
+    def __init__(self, server, capacity=10000):
+        self.server = server
+        self.capacity = capacity
+        self.entries = OrderedDict()  # (user_id, offset, limit) -> (etag, body)
+        self.lock = threading.Lock()
+        self.epoch = secrets.token_hex(4)
+        self.hits = 0
+        self.misses = 0
+
+    def etag(self, user_id, offset=0, limit=None):
+        if self.server.backend.shared:
+            return None
+        page = f'-{offset}-{limit}' if offset or limit is not None else ''
+        return f'"{self.epoch}-{self.server.device_version(user_id)}{page}"'
+
+    def get(self, user_id, offset=0, limit=None):
+        # Returns (etag, body). The version is read before the list, so a body
+        # is never cached under a newer version than the devices it holds.
+        etag = self.etag(user_id, offset, limit)
+        key = (user_id, offset, limit)
+        if etag is not None:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == etag:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+        self.misses += 1
+
+        devices = self.server.get_registered_devices(user_id)
+        if limit is None:
+            payload = {'user_id': user_id, 'devices': devices[offset:]}
+        else:
+            payload = {'user_id': user_id, 'devices': devices[offset:offset + limit], 'total': len(devices)}
+            if offset + limit < len(devices):
+                payload['next_offset'] = offset + limit
+        body = json.dumps(payload).encode()
+        if etag is None:
+            return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body
+        with self.lock:
+            self.entries[key] = (etag, body)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return etag, body
+
+    def respond(self, user_id, if_none_match=None, offset=0, limit=None):
+        # (etag, body), with body None when the client's copy is current (304).
+        etag = self.etag(user_id, offset, limit)
+        if not etag_matches(if_none_match, etag):
+            etag, body = self.get(user_id, offset, limit)
+            if not etag_matches(if_none_match, etag):
+                return etag, body
+        return etag, None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'capacity': self.capacity}
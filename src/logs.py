@@ -0,0 +1,74 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+MODES = ('async', 'buffered', 'direct')
+
+_stop = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats the message on the calling thread; the
+    # listener runs in this process, so hand it the record untouched and let
+    # it do the formatting.
+    def prepare(self, record):
+        return record
+
+
+def configure(level=logging.WARNING, stream=None, mode='async', capacity=1024):
+    """Send the 'sdil' loggers to stream (stderr by default) at level.
+
+    Log calls pass their values as arguments, so below the level nothing is
+    formatted. async queues records for a listener thread that formats and
+    writes them; buffered holds up to `capacity` records and writes them in
+    one go (at once for WARNING and above); direct writes on the caller's
+    thread. Calling it again replaces the previous configuration.
+    """
+    global _stop
+    if mode not in MODES:
+        raise ValueError(f"Unknown log mode: {mode}")
+    if _stop is not None:
+        _stop()
+
+    target = logging.StreamHandler(stream or sys.stderr)
+    target.setFormatter(logging.Formatter(FORMAT))
+    if mode == 'async':
+        records = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(records)
+        listener = logging.handlers.QueueListener(records, target)
+        listener.start()
+        stop = listener.stop
+    elif mode == 'buffered':
+        handler = logging.handlers.MemoryHandler(capacity, logging.WARNING, target)
+        stop = handler.flush
+    else:
+        handler = target
+        stop = target.flush
+
+    logger = logging.getLogger('sdil')
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+    def close():
+        # Flushes what is queued or buffered; safe to call more than once.
+        global _stop
+        if _stop is close:
+            _stop = None
+            logger.handlers = []
+            stop()
+            if not getattr(target.stream, 'closed', False):
+                target.flush()
+    _stop = close
+    return close
+
+
+@atexit.register
+def _close_at_exit():
+    # One hook for whatever configuration is current at exit; the stream may
+    # already be closed by then (e.g. a test runner's capture).
+    if _stop is not None:
+        _stop()
@@ -28,10 +28,7 @@ def simulate_sdi_l_login(user_id="user123"):
     wallet = SDILWallet()
     
     # Clean previous data for a fresh run demo (Essential for demo consistency)
-    if user_id in server.user_devices:
-        del server.user_devices[user_id]
-    if user_id in server.active_sessions:
-        del server.active_sessions[user_id]
+    server.delete_user(user_id)
     
     # 2. Key Generation & Registration
     animated_print("1. Initiating Secure Device Registration...")
@@ -74,8 +71,9 @@ def simulate_persistence_demo(user_id="user123"):
     # Restart the server instance (loads from saved DB)
     server = Server_Srav()
     
-    if user_id in server.active_sessions:
-        token = server.active_sessions[user_id]
+    sessions = server.get_sessions(user_id)
+    if sessions:
+        token = sessions[-1]
         print(f"Active Session Found in DB (Token: {token['token_id'][:8]}...).")
         
         valid = server.validate_session(user_id, token)
@@ -83,7 +81,7 @@ def simulate_persistence_demo(user_id="user123"):
         
         # Final cleanup demonstration
         if valid:
-            server.revoke_session(user_id)
+            server.revoke_session(user_id, token['token_id'])
             print("\033[93mSession revoked successfully (Logout complete).\033[0m")
     else:
         print("No active session found for user in DB.")
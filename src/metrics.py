@@ -0,0 +1,143 @@
+import bisect
+import threading
+
+# Latency buckets from 10µs to ~42s, doubling: one bisect per observation.
+BUCKETS = tuple(1e-5 * 2 ** i for i in range(23))
+INF = 'le="+Inf"'
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _merge(into, shard):
+    counters, histograms = into
+    for key, value in dict(shard[0]).items():
+        counters[key] = counters.get(key, 0) + value
+    for key, source in dict(shard[1]).items():
+        target = histograms.get(key)
+        if target is None:
+            target = histograms[key] = Histogram(source.bounds)
+        target.counts = [a + b for a, b in zip(target.counts, list(source.counts))]
+        target.sum += source.sum
+        target.count += source.count
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _series(name, labels, extra=''):
+    labels = ','.join(part for part in (labels, extra) if part)
+    return f'{name}{{{labels}}}' if labels else name
+
+
+class Metrics:
+    """Counters and fixed-bucket histograms rendered in the Prometheus text format.
+
+    Instrumented code holds either a Metrics or None and checks for None
+    before reading the clock, so turning metrics off costs one comparison.
+    Each thread updates its own shard without locking; render() merges them.
+    labels is a preformatted Prometheus label string such as 'mode="scan"'.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []  # (thread, (counters, histograms))
+        self.retired = ({}, {})  # merged shards of threads that have exited
+        self.gauges = {}
+
+    def _shard(self):
+        shard = self.local.shard = ({}, {})
+        with self.lock:
+            # A thread-per-request server starts a new thread for every
+            # request, so fold the shards of finished threads away here.
+            live = []
+            for thread, old in self.shards:
+                if thread.is_alive():
+                    live.append((thread, old))
+                else:
+                    _merge(self.retired, old)
+            live.append((threading.current_thread(), shard))
+            self.shards = live
+        return shard
+
+    def inc(self, name, amount=1, labels=''):
+        try:
+            counters = self.local.shard[0]
+        except AttributeError:
+            counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, labels=''):
+        try:
+            histograms = self.local.shard[1]
+        except AttributeError:
+            histograms = self._shard()[1]
+        histogram = histograms.get((name, labels))
+        if histogram is None:
+            histogram = histograms[(name, labels)] = Histogram()
+        histogram.observe(seconds)
+
+    def gauge(self, name, read, label='key'):
+        # read() is called at render time and returns a number or a {label_value: number} dict.
+        self.gauges[name] = (read, label)
+
+    def snapshot(self):
+        # Copies are taken without stopping writers, so a histogram's sum and
+        # count may be one observation apart; fine for monitoring.
+        with self.lock:
+            merged = ({}, {})
+            _merge(merged, self.retired)
+            for _, shard in self.shards:
+                _merge(merged, shard)
+        counters, histograms = merged
+        return counters, {key: (h.bounds, h.counts, h.sum, h.count) for key, h in histograms.items()}
+
+    def render(self):
+        counters, histograms = self.snapshot()
+        lines = []
+
+        last = None
+        for (name, labels), value in sorted(counters.items()):
+            if name != last:
+                lines.append(f'# TYPE {name} counter')
+                last = name
+            lines.append(f'{_series(name, labels)} {_number(value)}')
+
+        last = None
+        for (name, labels), (bounds, counts, total, count) in sorted(histograms.items()):
+            if name != last:
+                lines.append(f'# TYPE {name} histogram')
+                last = name
+            cumulative = 0
+            for bound, bucket in zip(bounds, counts):
+                cumulative += bucket
+                le = 'le="%g"' % bound
+                lines.append(f'{_series(name + "_bucket", labels, le)} {cumulative}')
+            lines.append(f'{_series(name + "_bucket", labels, INF)} {count}')
+            lines.append(f'{_series(name + "_sum", labels)} {_number(total)}')
+            lines.append(f'{_series(name + "_count", labels)} {count}')
+
+        for name, (read, label) in sorted(self.gauges.items()):
+            value = read()
+            lines.append(f'# TYPE {name} gauge')
+            if isinstance(value, dict):
+                for label_value, item in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{label_value}"}} {_number(item)}')
+            else:
+                lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,42 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimited(ValueError):
+    """A caller has used up its token bucket; HTTP entry points answer 429."""
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets refilling at `rate` tokens per second up to `burst`.
+
+    A bucket that has refilled completely behaves like no bucket at all, so
+    only the `max_keys` most recently used are kept; dropping the least
+    recently used one at worst hands that caller a fresh burst.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> (tokens, last refill)
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, last = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.rejected += 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed
+
+    def __len__(self):
+        return len(self.buckets)
@@ -0,0 +1,272 @@
+import threading
+from collections import OrderedDict
+
+
+class Challenge:
+    __slots__ = ('challenge_id', 'user_id', 'issued_at')
+
+    def __init__(self, challenge_id, user_id, issued_at):
+        self.challenge_id = challenge_id
+        self.user_id = user_id
+        self.issued_at = issued_at
+
+    @staticmethod
+    def id_for(value):
+        # Challenges are 256-bit random values, so the value itself is the key.
+        return format(value, 'x')
+
+
+class PendingChallenges:
+    """Pending challenges by id in issue order, holding at most max_size.
+
+    Challenges are issued in time order, so the oldest entry is also the
+    one closest to expiry; issuing past the bound evicts it in O(1).
+    Consuming a challenge pops it, so it can only be redeemed once.
+    """
+
+    def __init__(self, max_size=None):
+        self.entries = OrderedDict()
+        self.max_size = max_size
+        self.evictions = 0
+
+    def get(self, challenge_id, default=None):
+        return self.entries.get(challenge_id, default)
+
+    def pop(self, challenge_id, *default):
+        return self.entries.pop(challenge_id, *default)
+
+    def __setitem__(self, challenge_id, challenge):
+        self.entries[challenge_id] = challenge
+        if self.max_size is not None and len(self.entries) > self.max_size:
+            self.evicted(self.entries.popitem(last=False)[1])
+            self.evictions += 1
+
+    def evicted(self, challenge):
+        # Called with each challenge dropped to make room; for subclasses
+        # that mirror the map elsewhere.
+        pass
+
+    def values(self):
+        return self.entries.values()
+
+    def __getitem__(self, challenge_id):
+        return self.entries[challenge_id]
+
+    def __delitem__(self, challenge_id):
+        del self.entries[challenge_id]
+
+    def __contains__(self, challenge_id):
+        return challenge_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Session:
+    __slots__ = ('token_id', 'user_id', 'device_id', 'issued_at', 'expires_at')
+
+    def __init__(self, token_id, user_id, device_id, issued_at, expires_at):
+        self.token_id = token_id
+        self.user_id = user_id
+        self.device_id = device_id
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+
+    def to_token(self):
+        return {
+            'user_id': self.user_id,
+            'token_id': self.token_id,
+            'issued_at': self.issued_at,
+            'expires_at': self.expires_at,
+            'device_used': self.device_id
+        }
+
+
+def _unlink(index, key, item):
+    members = index.get(key)
+    if members is not None:
+        members.discard(item)
+        if not members:
+            del index[key]
+
+
+class SessionIndex:
+    """Active sessions by token id, with secondary indexes by user and device.
+
+    Bulk revocation walks only the k entries of that user or device.
+    """
+
+    def __init__(self):
+        self.by_token = {}
+        self.by_user = {}
+        self.by_device = {}
+
+    def add(self, session):
+        self.by_token[session.token_id] = session
+        self.by_user.setdefault(session.user_id, set()).add(session.token_id)
+        self.by_device.setdefault(session.device_id, set()).add(session.token_id)
+
+    def get(self, token_id):
+        return self.by_token.get(token_id)
+
+    def for_user(self, user_id):
+        return [self.by_token[token_id] for token_id in self.by_user.get(user_id, ())]
+
+    def pop(self, token_id):
+        session = self.by_token.pop(token_id, None)
+        if session is not None:
+            _unlink(self.by_user, session.user_id, token_id)
+            _unlink(self.by_device, session.device_id, token_id)
+        return session
+
+    def pop_user(self, user_id):
+        return [self.pop(token_id) for token_id in list(self.by_user.get(user_id, ()))]
+
+    def pop_device(self, device_id):
+        return [self.pop(token_id) for token_id in list(self.by_device.get(device_id, ()))]
+
+    def __len__(self):
+        return len(self.by_token)
+
+
+class ShardedSessionIndex:
+    """SessionIndex split into shards by user_id, each behind its own lock.
+
+    A session and its user and device index entries live in the shard of its
+    user, so adds and revocations only contend within a shard. by_token is a
+    single dict whose get is atomic, so validate_session's lookup takes no
+    lock; an entry appears there only once its shard has indexed it.
+    """
+
+    def __init__(self, shards=16):
+        self.shards = [SessionIndex() for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.by_token = {}
+
+    def _shard(self, user_id):
+        return hash(user_id) % len(self.shards)
+
+    def add(self, session):
+        n = self._shard(session.user_id)
+        with self.locks[n]:
+            self.shards[n].add(session)
+            self.by_token[session.token_id] = session
+
+    def get(self, token_id):
+        return self.by_token.get(token_id)
+
+    def for_user(self, user_id):
+        n = self._shard(user_id)
+        with self.locks[n]:
+            return self.shards[n].for_user(user_id)
+
+    def pop(self, token_id):
+        session = self.by_token.get(token_id)
+        if session is None:
+            return None
+        n = self._shard(session.user_id)
+        with self.locks[n]:
+            # None if another thread popped it since the lookup above.
+            session = self.shards[n].pop(token_id)
+            if session is not None:
+                del self.by_token[token_id]
+        return session
+
+    def _pop_all(self, sessions):
+        for session in sessions:
+            del self.by_token[session.token_id]
+        return sessions
+
+    def pop_user(self, user_id):
+        n = self._shard(user_id)
+        with self.locks[n]:
+            return self._pop_all(self.shards[n].pop_user(user_id))
+
+    def pop_device(self, device_id):
+        # A device belongs to one user, but only the device id is known here;
+        # peek at each shard's index and lock just the one that has it.
+        popped = []
+        for n, shard in enumerate(self.shards):
+            if device_id in shard.by_device:
+                with self.locks[n]:
+                    popped.extend(self._pop_all(shard.pop_device(device_id)))
+        return popped
+
+    def __len__(self):
+        return len(self.by_token)
+
+
+class ShardedDevices:
+    """Per-user device lists split into shards by user_id, each behind its own lock.
+
+    Writers replace a user's list with an extended copy under the shard's
+    lock instead of appending in place, so readers (every verification)
+    take no lock and always see a complete list.
+    """
+
+    def __init__(self, shards=16):
+        self.shards = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, user_id):
+        return hash(user_id) % len(self.shards)
+
+    def get(self, user_id, default=None):
+        return self.shards[self._shard(user_id)].get(user_id, default)
+
+    def add(self, user_id, device):
+        n = self._shard(user_id)
+        with self.locks[n]:
+            self.shards[n][user_id] = self.shards[n].get(user_id, []) + [device]
+
+    def extend(self, user_id, devices):
+        # Adds the devices whose device_id the user does not have yet, with
+        # one copy of the list; returns how many were added.
+        n = self._shard(user_id)
+        with self.locks[n]:
+            existing = self.shards[n].get(user_id, [])
+            seen = {d['device_id'] for d in existing}
+            new = [d for d in devices if d['device_id'] not in seen and not seen.add(d['device_id'])]
+            if new:
+                self.shards[n][user_id] = existing + new
+        return len(new)
+
+    def pop(self, user_id, default=None):
+        n = self._shard(user_id)
+        with self.locks[n]:
+            return self.shards[n].pop(user_id, default)
+
+    def load(self, rows):
+        # Bulk load of (user_id, device) pairs: each shard's dict is built
+        # unlocked and published with a single assignment; users already
+        # present keep their list.
+        shards = [{} for _ in self.shards]
+        for user_id, device in rows:
+            shard = shards[hash(user_id) % len(shards)]
+            devices = shard.get(user_id)
+            if devices is None:
+                shard[user_id] = [device]
+            else:
+                devices.append(device)
+        for n, shard in enumerate(shards):
+            with self.locks[n]:
+                shard.update(self.shards[n])
+                self.shards[n] = shard
+
+    def __setitem__(self, user_id, devices):
+        n = self._shard(user_id)
+        with self.locks[n]:
+            self.shards[n][user_id] = list(devices)
+
+    def __getitem__(self, user_id):
+        return self.shards[self._shard(user_id)][user_id]
+
+    def __contains__(self, user_id):
+        return user_id in self.shards[self._shard(user_id)]
+
+    def values(self):
+        for shard in self.shards:
+            yield from list(shard.values())
+
+    def __len__(self):
+        return sum(map(len, self.shards))
@@ -1,156 +1,509 @@
+import itertools
+import logging
 import secrets
+import threading
 import time
-import sqlite3
-import json
+from collections import OrderedDict, namedtuple
+
+import bulk
+from backends import MemoryBackend
+from expiry import ExpiryWheel
+from ratelimit import RateLimited
+from records import Challenge, Session, ShardedDevices
+from storage import SQLiteStore, StoreSessions, DeviceCache
+from verifier import ProofVerifier, match_device
+
+# Values are passed as arguments, so nothing is formatted unless the level is
+# enabled; see logs.configure for where the records go.
+log = logging.getLogger('sdil.server')
+
+# Returned by prepare_verification: match_device's arguments, whether the
+# match is worth sending to the crypto executor, and its metrics label.
+ProofMatch = namedtuple('ProofMatch', 'user_id challenge args offload mode')
 
 class Server_Srav:
-    def __init__(self, db_path="sdi_l.db"):
+    def __init__(self, db_path="sdi_l.db", lazy=False, cache_size=100000, executor=None, token_signer=None,
+                 backend=MemoryBackend, metrics=None, challenge_limiter=None, shards=16, store=SQLiteStore):
         self.db_path = db_path
-        self.user_devices = {}
-        self.challenge_timestamps = {}
-        self.active_sessions = {}
+        self.executor = executor
+        # A metrics.Metrics, or None to skip instrumentation entirely.
+        self.metrics = metrics
+        # With a TokenSigner, sessions are signed blobs validated without any
+        # lookup; revocation records a cutoff per token, user or device instead
+        # of deleting anything.
+        self.signer = token_signer
+        self.revocations = {}
+        # A ratelimit.TokenBucketLimiter keyed by user_id, or None for no limit.
+        self.challenge_limiter = challenge_limiter
+        self.challenge_counts = {'issued': 0, 'rate_limited': 0, 'replays_rejected': 0}
         self.TTL = 60
         self.SESSION_EXPIRY = 3600
         self.P = 2**256 - 189
         self.G = 3
-        self._init_db()
-        self._load_from_db()
-
-    def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_devices (
-                user_id TEXT,
-                device_id TEXT,
-                public_ver_key TEXT,
-                PRIMARY KEY (user_id, device_id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS active_sessions (
-                user_id TEXT PRIMARY KEY,
-                token_json TEXT
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def _load_from_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id, device_id, public_ver_key FROM user_devices')
-        for row in cursor.fetchall():
-            user_id, device_id, pub_key_str = row
-            pub_key = int(pub_key_str)
-            if user_id not in self.user_devices:
-                self.user_devices[user_id] = []
-            self.user_devices[user_id].append({'device_id': device_id, 'public_ver_key': pub_key})
-        cursor.execute('SELECT user_id, token_json FROM active_sessions')
-        for row in cursor.fetchall():
-            user_id, token_json = row
-            self.active_sessions[user_id] = json.loads(token_json)
-        conn.close()
-
-    def _save_to_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM user_devices')
-        for user_id, devices in self.user_devices.items():
-            for device in devices:
-                pub_key_str = str(device['public_ver_key'])
-                cursor.execute('INSERT INTO user_devices VALUES (?, ?, ?)',
-                               (user_id, device['device_id'], pub_key_str))
-        cursor.execute('DELETE FROM active_sessions')
-        for user_id, token in self.active_sessions.items():
-            cursor.execute('INSERT INTO active_sessions VALUES (?, ?)',
-                           (user_id, json.dumps(token)))
-        conn.commit()
-        conn.close()
+        self.verifier = ProofVerifier(self.P)
+        self.expiry = ExpiryWheel()
+        self.expiry_stats = {'ticks': 0, 'challenges': 0, 'sessions': 0, 'last_tick': None}
+        self._last_sweep = 0.0
+        # Called with (db_path, metrics): SQLiteStore, or journal.JournalStore
+        # for snapshot + journal persistence.
+        self.store = store(db_path, metrics)
+        # Bumped whenever a user's device list changes in this process; values
+        # come from one counter, so they never repeat.
+        self.device_versions = OrderedDict()
+        self._device_clock = itertools.count(1)
+        # Only the cache_size most recently changed users keep a version, and
+        # deleted users none. Users without one read the counter value taken
+        # when a version was last dropped, which is newer than any version
+        # they had before, so an old ETag never matches again.
+        self._max_device_versions = cache_size
+        self._version_floor = 0
+        self._versions_lock = threading.Lock()
+        # The backend owns pending challenges (by challenge id) and, unless it
+        # leaves them to the store, active sessions (by token id, indexed by
+        # user and device); shared backends let several worker processes
+        # serve the same users.
+        self.backend = backend(self.store)
+        if self.backend.shared and not isinstance(self.store, SQLiteStore):
+            raise ValueError("Shared state backends need the SQLite store")
+        self.challenges = self.backend.challenges
+        if not self.backend.shared:
+            # Challenges restored from the last run by a persistent store.
+            for challenge in list(self.challenges.values()):
+                self.expiry.schedule(('challenge', challenge.challenge_id), challenge.issued_at + self.TTL)
+        self.lazy = lazy or self.backend.sessions is None
+        self.sessions = StoreSessions(self.store) if self.lazy else self.backend.sessions
+        if self.lazy or self.backend.shared:
+            # Devices are read per user through the primary key and kept in a
+            # bounded LRU; another process may register devices at any time,
+            # so shared backends read them through on every access.
+            self.user_devices = DeviceCache(self.store, 0 if self.backend.shared else cache_size)
+        else:
+            # Request threads share the server: device lists are sharded by
+            # user with a lock per shard and read without locking.
+            self.user_devices = ShardedDevices(shards)
+            self._load_devices()
+        if not self.lazy and not len(self.sessions):
+            self._load_sessions()
+        if token_signer is not None:
+            for subject, revoked_at in self.store.load_revocations(time.time() - self.SESSION_EXPIRY):
+                self.revocations[subject] = revoked_at
+                self.expiry.schedule(('revocation', subject), revoked_at + self.SESSION_EXPIRY)
+        if not self.lazy and log.isEnabledFor(logging.INFO):
+            log.info("Loaded %d devices and %d sessions from %s", sum(map(len, self.user_devices.values())),
+                     len(self.sessions), db_path)
+
+    def _load_devices(self):
+        self.user_devices.load((user_id, {'device_id': device_id, 'public_ver_key': pub_key})
+                               for user_id, device_id, pub_key in self.store.load_devices())
+
+    def _load_sessions(self):
+        for session in self.store.load_sessions():
+            self.sessions.add(session)
+            self.expiry.schedule(('session', session.token_id), session.expires_at)
+
+    def cache_stats(self):
+        return self.user_devices.stats() if isinstance(self.user_devices, DeviceCache) else {}
+
+    def challenge_stats(self):
+        return dict(self.challenge_counts, pending=len(self.challenges),
+                    evicted=getattr(self.challenges, 'evictions', 0))
 
     def register_device(self, user_id, public_ver_key, suppress_output=False):
-        if user_id not in self.user_devices:
-            self.user_devices[user_id] = []
+        if not 0 < public_ver_key < self.P:
+            raise ValueError("public_ver_key out of range")
         device_id = secrets.token_hex(8)
         device = {'device_id': device_id, 'public_ver_key': public_ver_key}
-        self.user_devices[user_id].append(device)
+        self.user_devices.add(user_id, device)
+        self._bump_device_version(user_id)
         if not suppress_output:
-            print(f"Device {device_id[:4]}... registered for user {user_id}.")
-        self._save_to_db()
+            log.info("Device %.4s... registered for user %s", device_id, user_id)
+        self.store.add_device(user_id, device_id, public_ver_key)
+        return device_id
+
+    def import_devices(self, records, chunk_size=50000):
+        # records are (line_number, user_id, public_ver_key, device_id), e.g.
+        # from bulk.read_records; see bulk.import_devices for the returned stats.
+        return bulk.import_devices(self.store, records, chunk_size, self.P, self._add_imported)
+
+    def _add_imported(self, rows):
+        by_user = {}
+        for user_id, device_id, pub_key in rows:
+            by_user.setdefault(user_id, []).append({'device_id': device_id, 'public_ver_key': pub_key})
+        for user_id, devices in by_user.items():
+            self._bump_device_version(user_id)
+            if isinstance(self.user_devices, DeviceCache):
+                # Cached users may have gained devices; they are re-read on next access.
+                self.user_devices.pop(user_id, None)
+            else:
+                self.user_devices.extend(user_id, devices)
+
+    def delete_user(self, user_id):
+        self.user_devices.pop(user_id, None)
+        self._drop_device_version(user_id)
+        self.sessions.pop_user(user_id)
+        self.store.delete_user(user_id)
 
     def get_registered_devices(self, user_id):
-        if user_id not in self.user_devices:
-            return []
-        return [d['device_id'] for d in self.user_devices[user_id]]
+        return [d['device_id'] for d in self.user_devices.get(user_id, [])]
 
-    def generate_challenge(self, user_id):
-        if user_id not in self.user_devices or not self.user_devices[user_id]:
+    def device_version(self, user_id):
+        # Changes whenever the user's devices change in this process; another
+        # process sharing the DB does not bump it.
+        return self.device_versions.get(user_id, self._version_floor)
+
+    def _bump_device_version(self, user_id):
+        with self._versions_lock:
+            self.device_versions[user_id] = next(self._device_clock)
+            self.device_versions.move_to_end(user_id)
+            if len(self.device_versions) > self._max_device_versions:
+                self.device_versions.popitem(last=False)
+                self._version_floor = next(self._device_clock)
+
+    def _drop_device_version(self, user_id):
+        with self._versions_lock:
+            self.device_versions.pop(user_id, None)
+            self._version_floor = next(self._device_clock)
+
+    def issue_challenge(self, user_id):
+        if self.metrics is None:
+            return self._issue_challenge(user_id)
+        start = time.perf_counter()
+        issued = self._issue_challenge(user_id)
+        self.metrics.observe('sdil_challenge_issue_seconds', time.perf_counter() - start)
+        self.metrics.inc('sdil_challenges_issued_total')
+        return issued
+
+    def _issue_challenge(self, user_id):
+        if not self.user_devices.get(user_id):
             raise ValueError(f"No devices registered for {user_id}!")
-        challenge = secrets.randbelow(self.P)
-        timestamp = time.time()
-        self.challenge_timestamps[user_id] = timestamp
-        return challenge
+        if self.challenge_limiter is not None and not self.challenge_limiter.allow(user_id):
+            self.challenge_counts['rate_limited'] += 1
+            log.info("Challenge request for %s rate limited", user_id)
+            raise RateLimited(f"Too many challenge requests for {user_id}!")
+        value = secrets.randbelow(self.P)
+        challenge = Challenge(Challenge.id_for(value), user_id, time.time())
+        self.challenges[challenge.challenge_id] = challenge
+        self.expiry.schedule(('challenge', challenge.challenge_id), challenge.issued_at + self.TTL)
+        self.challenge_counts['issued'] += 1
+        log.debug("Challenge generated for %s: %d (issued at %.0f)", user_id, value, challenge.issued_at)
+        return value, challenge
+
+    def generate_challenge(self, user_id):
+        return self.issue_challenge(user_id)[0]
+
+    def _pending_challenge(self, user_id, challenge):
+        pending = self.challenges.get(Challenge.id_for(challenge))
+        return pending if pending is not None and pending.user_id == user_id else None
 
-    def verify_zkp_proof(self, user_id, challenge, proof):
-        if user_id not in self.user_devices or not self.user_devices[user_id]:
+    def _outcome(self, outcome):
+        # outcome is one of no_devices, no_challenge, invalid, expired or success.
+        if outcome == 'no_challenge':
+            # Never issued to this user, or already consumed, expired or evicted.
+            self.challenge_counts['replays_rejected'] += 1
+        if self.metrics is not None:
+            self.metrics.inc('sdil_verify_total', labels=f'outcome="{outcome}"')
+
+    def _match_mode(self, devices, device_id):
+        # hinted is a single exponentiation; scan is one per device until a
+        # match; table shares a fixed-base table across the user's devices.
+        if device_id is not None:
+            return 'mode="hinted"'
+        return 'mode="table"' if len(devices) >= self.verifier.table_threshold else 'mode="scan"'
+
+    def _offload(self, devices, device_id):
+        # A hint or a single device is one exponentiation, cheaper than the
+        # round trip to a worker process; only scans over several devices
+        # (and batches) are worth sending to the executor.
+        return self.executor is not None and device_id is None and len(devices) > 1
+
+    def _verification_devices(self, user_id, challenge):
+        devices = self.user_devices.get(user_id)
+        if not devices:
+            self._outcome('no_devices')
             raise ValueError(f"No devices registered for {user_id}!")
-        if user_id not in self.challenge_timestamps:
+        if self._pending_challenge(user_id, challenge) is None:
+            self._outcome('no_challenge')
             raise ValueError(f"No active challenge for {user_id}!")
-        
-        P = self.P
-        verified_with_device = None
-        
-        for device in self.user_devices[user_id]:
-            public_key = device['public_ver_key']
-            expected_proof = pow(challenge, public_key, P)
-            if proof == expected_proof:
-                verified_with_device = device['device_id']
-                break
-        
+        return devices
+
+    def verify_zkp_proof(self, user_id, challenge, proof, device_id=None):
+        if self.metrics is None:
+            return self._verify_zkp_proof(user_id, challenge, proof, device_id)
+        start = time.perf_counter()
+        try:
+            return self._verify_zkp_proof(user_id, challenge, proof, device_id)
+        finally:
+            self.metrics.observe('sdil_verify_seconds', time.perf_counter() - start)
+
+    def _verify_zkp_proof(self, user_id, challenge, proof, device_id):
+        match = self.prepare_verification(user_id, challenge, proof, device_id)
+        started = time.perf_counter() if self.metrics is not None else None
+        if match.offload:
+            verified_with_device = self.executor.submit(match_device, *match.args).result()
+        else:
+            verified_with_device = self.verifier.match(*match.args[1:])
+        return self.complete_verification(match, verified_with_device, started)
+
+    def prepare_verification(self, user_id, challenge, proof, device_id=None):
+        # First half of verify_zkp_proof, for callers that run the match
+        # themselves (batches, the ASGI facade): raises ValueError like
+        # verify_zkp_proof, and returns a ProofMatch.
+        devices = self._verification_devices(user_id, challenge)
+        return ProofMatch(user_id, challenge, (self.P, challenge, proof, devices, device_id),
+                          self._offload(devices, device_id), self._match_mode(devices, device_id))
+
+    def complete_verification(self, match, verified_with_device, match_started=None):
+        # Second half: verified_with_device is what match_device returned for
+        # match.args; match_started, a perf_counter() reading, times the match.
+        if self.metrics is not None and match_started is not None:
+            self.metrics.observe('sdil_verify_match_seconds', time.perf_counter() - match_started,
+                                 labels=match.mode)
+        # Another request, or an earlier item of a batch, may have consumed
+        # the challenge while this one was matching.
+        if self._pending_challenge(match.user_id, match.challenge) is None:
+            self._outcome('no_challenge')
+            raise ValueError(f"No active challenge for {match.user_id}!")
+        # One transaction, so the consumed challenge and the new session are
+        # made durable by a single commit before the token is returned.
+        with self.store.transaction():
+            return self._complete_verification(match.user_id, match.challenge, verified_with_device)
+
+    def verify_zkp_proof_batch(self, items):
+        # items are (user_id, challenge, proof) or (user_id, challenge, proof, device_id).
+        # Each result is (verified, token, error) where error is the
+        # ValueError verify_zkp_proof would have raised for that item.
+        results, jobs = self.prepare_batch(items)
+        calls = [match.args for _, match in jobs]
+        started = time.perf_counter() if self.metrics is not None else None
+        if self.executor is not None:
+            matches = self.executor.map(match_device, *zip(*calls))
+        else:
+            matches = [match_device(*args) for args in calls]
+        return self.complete_batch(results, jobs, matches, started)
+
+    def prepare_batch(self, items):
+        # First half of verify_zkp_proof_batch: returns (results, jobs), where
+        # results holds the items that already failed and jobs pairs the
+        # index of every other item with its ProofMatch.
+        results = [None] * len(items)
+        jobs = []
+        for i, (user_id, challenge, proof, *hint) in enumerate(items):
+            try:
+                jobs.append((i, self.prepare_verification(user_id, challenge, proof, hint[0] if hint else None)))
+            except ValueError as e:
+                results[i] = (False, None, e)
+        return results, jobs
+
+    def complete_batch(self, results, jobs, matches, match_started=None):
+        # Second half: matches are what match_device returned for each job's
+        # args, in order; every session is written in one transaction.
+        if self.metrics is not None and match_started is not None and jobs:
+            self.metrics.observe('sdil_verify_batch_match_seconds', time.perf_counter() - match_started)
+            self.metrics.inc('sdil_verify_batch_items_total', len(jobs))
+        with self.store.transaction():
+            for (i, match), verified_with_device in zip(jobs, matches):
+                try:
+                    results[i] = self.complete_verification(match, verified_with_device) + (None,)
+                except ValueError as e:
+                    results[i] = (False, None, e)
+        return results
+
+    def _complete_verification(self, user_id, challenge, verified_with_device):
         if verified_with_device is None:
+            self._outcome('invalid')
+            log.info("ZKP verification failed for %s: no matching device", user_id)
             return False, None
         
-        issue_time = self.challenge_timestamps[user_id]
+        # The owner is checked before anything is removed, so a proof for
+        # one user cannot use up another's challenge; the challenge is then
+        # consumed before the session is made, so with a shared backend only
+        # one worker can turn it into a session.
+        challenge_id = Challenge.id_for(challenge)
+        pending = self.challenges.get(challenge_id)
+        if pending is None or pending.user_id != user_id or self.challenges.pop(challenge_id, None) is None:
+            self._outcome('no_challenge')
+            return False, None
         current_time = time.time()
-        if current_time - issue_time > self.TTL:
-            del self.challenge_timestamps[user_id]
+        if current_time - pending.issued_at > self.TTL:
+            self._outcome('expired')
+            log.info("ZKP verification failed for %s: challenge expired (%.1fs > %ds)", user_id,
+                     current_time - pending.issued_at, self.TTL)
             return False, None
         
-        token_id = secrets.token_hex(16)
-        token = {
-            'user_id': user_id,
-            'token_id': token_id,
-            'issued_at': current_time,
-            'expires_at': current_time + self.SESSION_EXPIRY,
-            'device_used': verified_with_device
-        }
-        self.active_sessions[user_id] = token
-        del self.challenge_timestamps[user_id]
-        self._save_to_db()
+        token_id = secrets.token_hex(16) if self.signer is None else self.signer.token_id(user_id)
+        session = Session(token_id, user_id, verified_with_device, current_time, current_time + self.SESSION_EXPIRY)
+        token = session.to_token()
+        self._outcome('success')
+        log.debug("ZKP verification success for %s via device %.4s... (%.1fs into TTL); session %.8s...",
+                  user_id, verified_with_device, current_time - pending.issued_at, session.token_id)
+        if self.signer is not None:
+            token['signed'] = self.signer.sign(token)
+            return True, token
+        try:
+            self.sessions.add(session)
+        except ValueError:
+            # A full shared session table, or a session too large for a
+            # slot: hand the challenge back so the login can be retried.
+            self.challenges[challenge_id] = pending
+            raise
+        if not self.lazy:
+            self.expiry.schedule(('session', session.token_id), session.expires_at)
+            self.store.put_session(session)
         return True, token
 
-    def revoke_session(self, user_id):
-        if user_id in self.active_sessions:
-            del self.active_sessions[user_id]
-            self._save_to_db()
-            return True
-        else:
+    def get_sessions(self, user_id):
+        current_time = time.time()
+        return [s.to_token() for s in self.sessions.for_user(user_id) if s.expires_at >= current_time]
+
+    def _revoke(self, subject):
+        # Every token issued for the subject up to now becomes invalid.
+        revoked_at = time.time()
+        self.revocations[subject] = revoked_at
+        self.expiry.schedule(('revocation', subject), revoked_at + self.SESSION_EXPIRY)
+        self.store.put_revocation(subject, revoked_at)
+        return True
+
+    def revoke_session(self, user_id, token_id=None):
+        # Without a token_id every session of the user is revoked.
+        log.info("Revoking sessions of %s (token %.8s)", user_id, token_id or "all")
+        if token_id is None:
+            if self.signer is not None:
+                return self._revoke(f'user:{user_id}')
+            revoked = self.sessions.pop_user(user_id)
+            if not self.lazy:
+                self.store.delete_user_sessions(user_id)
+            return bool(revoked)
+        if self.signer is not None:
+            # Signed token ids carry a MAC over their user, so an id that is
+            # made up or belongs to someone else is refused like in stateful mode.
+            if not self.signer.owns(user_id, token_id):
+                return False
+            return self._revoke(f'token:{token_id}')
+        session = self.sessions.get(token_id)
+        if session is None or session.user_id != user_id:
             return False
+        self.sessions.pop(token_id)
+        if not self.lazy:
+            self.store.delete_session(token_id)
+        return True
+
+    def revoke_device_sessions(self, user_id, device_id):
+        if device_id not in self.get_registered_devices(user_id):
+            return False
+        log.info("Revoking sessions of device %.4s... for %s", device_id, user_id)
+        if self.signer is not None:
+            return self._revoke(f'device:{device_id}')
+        revoked = self.sessions.pop_device(device_id)
+        if not self.lazy:
+            self.store.delete_device_sessions(device_id)
+        return bool(revoked)
 
     def validate_session(self, user_id, token):
-        if user_id not in self.active_sessions:
+        if self.metrics is None:
+            valid = self._validate_session(user_id, token)
+        else:
+            start = time.perf_counter()
+            valid = self._validate_session(user_id, token)
+            self.metrics.observe('sdil_session_validate_seconds', time.perf_counter() - start)
+            self.metrics.inc('sdil_session_validations_total', labels='valid="true"' if valid else 'valid="false"')
+        log.debug("Session validation for %s: %s", user_id, "valid" if valid else "rejected")
+        return valid
+
+    def _validate_session(self, user_id, token):
+        if self.signer is not None:
+            return self._validate_signed(user_id, token)
+        token_id = token.get('token_id')
+        session = self.sessions.get(token_id) if token_id else None
+        if session is None or session.user_id != user_id:
             return False
-        stored_token = self.active_sessions[user_id]
         current_time = time.time()
-        if stored_token['expires_at'] < current_time:
-            del self.active_sessions[user_id]
-            self._save_to_db()
+        if session.expires_at < current_time:
+            self.sessions.pop(token_id)
+            if not self.lazy:
+                self.store.delete_session(token_id)
             return False
-        
-        if token['token_id'] != stored_token['token_id']:
-             return False
 
         return True
 
+    def _validate_signed(self, user_id, token):
+        claims = self.signer.unsign(token if isinstance(token, str) else token.get('signed', ''))
+        if claims is None or claims['user_id'] != user_id:
+            return False
+        if claims['expires_at'] < time.time():
+            return False
+        subjects = (f"user:{user_id}", f"device:{claims['device_used']}", f"token:{claims['token_id']}")
+        # Workers sharing a backend revoke independently, and only the
+        # revocations table sees all of them.
+        revocations = self.store.get_revocations(subjects) if self.backend.shared else self.revocations
+        for subject in subjects:
+            revoked_at = revocations.get(subject)
+            if revoked_at is not None and claims['issued_at'] <= revoked_at:
+                return False
+        return True
+
+    def expire_entries(self, now=None):
+        current_time = time.time() if now is None else now
+        challenges = 0
+        expired_sessions = []
+        expired_revocations = []
+        # One transaction, so a journal store commits the tick's challenge
+        # deletes as one group rather than one commit each.
+        with self.store.transaction():
+            for kind, key in self.expiry.tick(current_time):
+                # Keys are never cancelled, so skip entries that were consumed or
+                # revoked since they were scheduled.
+                if kind == 'challenge':
+                    pending = self.challenges.get(key)
+                    if pending is not None and current_time - pending.issued_at > self.TTL:
+                        self.challenges.pop(key, None)
+                        challenges += 1
+                elif kind == 'revocation':
+                    revoked_at = self.revocations.get(key)
+                    if revoked_at is not None and revoked_at + self.SESSION_EXPIRY < current_time:
+                        self.revocations.pop(key, None)
+                        expired_revocations.append(key)
+                else:
+                    session = self.sessions.get(key)
+                    if session is not None and session.expires_at < current_time:
+                        self.sessions.pop(key)
+                        expired_sessions.append(key)
+
+        if self.lazy:
+            # Sessions are not held in memory; let the expires_at index find them.
+            sessions = self.store.delete_expired_sessions(current_time)
+        else:
+            self.store.delete_sessions(expired_sessions)
+            sessions = len(expired_sessions)
+
+        self.store.delete_revocations(expired_revocations)
+
+        if self.backend.shared and current_time - self._last_sweep >= self.TTL:
+            # The wheel only knows what this process issued; entries left by
+            # other (possibly crashed) workers are found by scanning the backend.
+            self._last_sweep = current_time
+            swept_challenges, swept_sessions = self.backend.sweep(current_time, self.TTL)
+            challenges += swept_challenges
+            if not self.lazy:
+                self.store.delete_expired_sessions(current_time)
+                sessions += swept_sessions
+
+        tick = {'challenges': challenges, 'sessions': sessions}
+        self.expiry_stats['ticks'] += 1
+        self.expiry_stats['challenges'] += challenges
+        self.expiry_stats['sessions'] += sessions
+        self.expiry_stats['last_tick'] = tick
+        return tick
+
+    def start_expiry(self, interval=1.0):
+        def run():
+            while not stop.wait(interval):
+                self.expire_entries()
+        stop = threading.Event()
+        threading.Thread(target=run, name='sdil-expiry', daemon=True).start()
+        return stop
+
+    def close(self):
+        self.store.close()
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Server wiring shared by the Flask (app.py) and ASGI (asgi_app.py) entry points."""
+from backends import make_backend
+from crypto_executor import CryptoExecutor
+from journal import make_store
+from listing import DeviceListings
+from metrics import Metrics
+from ratelimit import TokenBucketLimiter
+from server_srav import Server_Srav
+from signed_tokens import TokenSigner
+
+
+def build_server(config):
+    # Returns (server, crypto_executor, metrics, device_listings) built from
+    # the config module, with the executor's workers started and every
+    # gauge registered. Logging and the expiry loop are left to the caller.
+    crypto_executor = CryptoExecutor(config.CRYPTO_WORKERS)
+    crypto_executor.start()
+    token_signer = TokenSigner(config.SESSION_SECRET) if config.SESSION_TOKENS == 'signed' else None
+    # Buckets are per process, so with a shared backend each worker grants its own rate.
+    challenge_limiter = (TokenBucketLimiter(config.CHALLENGE_RATE, config.CHALLENGE_BURST)
+                         if config.CHALLENGE_RATE > 0 else None)
+    metrics = Metrics() if config.METRICS else None
+    # The journal store already holds every device and session in memory;
+    # eager indexes on top of it would hold each of them a second time.
+    lazy = config.LAZY_LOAD or config.PERSISTENCE == 'journal'
+    server = Server_Srav(config.DB_PATH, lazy=lazy, cache_size=config.DEVICE_CACHE_SIZE,
+                         executor=crypto_executor, token_signer=token_signer,
+                         backend=make_backend(config.STATE_BACKEND, config.SHM_CAPACITY,
+                                              config.MAX_PENDING_CHALLENGES, config.SHARDS),
+                         metrics=metrics, challenge_limiter=challenge_limiter, shards=config.SHARDS,
+                         store=make_store(config.PERSISTENCE, config.JOURNAL_FSYNC, config.SNAPSHOT_EVERY))
+    device_listings = DeviceListings(server, config.DEVICE_LISTING_CACHE_SIZE)
+
+    if metrics is not None:
+        metrics.gauge('sdil_crypto_executor', crypto_executor.stats, label='stat')
+        metrics.gauge('sdil_device_cache', server.cache_stats, label='stat')
+        metrics.gauge('sdil_challenge_store', server.challenge_stats, label='stat')
+        metrics.gauge('sdil_device_listings', device_listings.stats, label='stat')
+        metrics.gauge('sdil_pending_challenges', lambda: len(server.challenges))
+        if hasattr(server.store, 'stats'):
+            metrics.gauge('sdil_journal', server.store.stats, label='stat')
+    return server, crypto_executor, metrics, device_listings
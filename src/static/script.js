@@ -1,23 +1,47 @@
-const P = 2n ** 256n - 189n;
-
-// Modular Exponentiation: base^exp % mod
-function modPow(base, exponent, modulus) {
-    if (modulus === 1n) return 0n;
-    let result = 1n;
-    base = base % modulus;
-    while (exponent > 0n) {
-        if (exponent % 2n === 1n) result = (result * base) % modulus;
-        exponent = exponent >> 1n;
-        base = (base * base) % modulus;
+// Key generation and proofs run in zkp_worker.js so a login never stalls the
+// page; without Worker support the same zkp_math.js code runs inline.
+const zkp = (() => {
+    if (!window.Worker) {
+        const randomBytes = n => window.crypto.getRandomValues(new Uint8Array(n));
+        return {
+            keygen: async () => SDILMath.generateMasterKey(randomBytes).toString(),
+            load: async () => true,
+            proof: async (key, challenge) => SDILMath.powModP(BigInt(challenge), BigInt(key)).toString()
+        };
     }
-    return result;
+    const worker = new Worker(new URL('zkp_worker.js', document.currentScript.src));
+    const pending = new Map();
+    let nextId = 0;
+    worker.onmessage = ({ data }) => {
+        const { resolve, reject } = pending.get(data.id);
+        pending.delete(data.id);
+        if (data.error) reject(new Error(data.error));
+        else resolve(data.result);
+    };
+    const call = (op, args) => new Promise((resolve, reject) => {
+        const id = nextId++;
+        pending.set(id, { resolve, reject });
+        worker.postMessage({ id, op, ...args });
+    });
+    // Keys and challenges cross to the worker as decimal strings.
+    return {
+        keygen: () => call('keygen'),
+        load: key => call('load', { key }),
+        proof: (key, challenge) => call('proof', { key, challenge })
+    };
+})();
+
+// The challenge is a 256-bit JSON number, which JSON.parse would round to a
+// double; take its digits from the raw body instead.
+function challengeDigits(body) {
+    const match = /"challenge"\s*:\s*"?(\d+)/.exec(body);
+    return match ? match[1] : null;
 }
 
-function generateMasterKey() {
-    const array = new Uint8Array(32);
-    window.crypto.getRandomValues(array);
-    const hex = "0x" + Array.from(array).map(b => b.toString(16).padStart(2, "0")).join("");
-    return BigInt(hex) % P;
+// Have the worker recode a stored key before the user clicks login.
+function preloadKey(userId) {
+    const keyStr = localStorage.getItem(`sdi_l_key_${userId}`);
+    if (keyStr) zkp.load(keyStr).catch(() => {});
 }
 
 // State
@@ -68,12 +92,13 @@ document.getElementById('btn-register').addEventListener('click', async () => {
     const userId = document.getElementById('reg-user-id').value.trim();
     if (!userId) return alert('Please enter User ID');
 
-    // Generate Key
-    currentMasterKey = generateMasterKey();
-    log(`Generated Master Key (x): ${currentMasterKey.toString().substring(0, 16)}...`, 'success');
+    // Generate Key (the worker has the next one ready)
+    currentMasterKey = await zkp.keygen();
+    log(`Generated Master Key (x): ${currentMasterKey.substring(0, 16)}...`, 'success');
 
     // Save locally for convenience
-    localStorage.setItem(`sdi_l_key_${userId}`, currentMasterKey.toString());
+    localStorage.setItem(`sdi_l_key_${userId}`, currentMasterKey);
+    zkp.load(currentMasterKey);
 
     // Register with Server (Sending x as public_ver_key per PoC)
     try {
@@ -82,12 +107,13 @@ document.getElementById('btn-register').addEventListener('click', async () => {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 user_id: userId,
-                public_ver_key: currentMasterKey.toString() // Send as string
+                public_ver_key: currentMasterKey // Send as string
             })
         });
         const data = await res.json();
         if (res.ok) {
             log(`Registration Successful: ${data.message}`, 'success');
+            localStorage.setItem(`sdi_l_device_${userId}`, data.device_id);
             currentUserId = userId;
             // Switch to Login
             document.getElementById('login-user-id').value = userId;
@@ -111,7 +137,7 @@ document.getElementById('btn-login').addEventListener('click', async () => {
         log('No key found for this user in local storage. Please register first.', 'error');
         return;
     }
-    currentMasterKey = BigInt(keyStr);
+    currentMasterKey = keyStr;
     currentUserId = userId;
 
     log('Starting ZKP Login Sequence...');
@@ -124,17 +150,18 @@ document.getElementById('btn-login').addEventListener('click', async () => {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ user_id: userId })
         });
-        const dataChallenge = await resChallenge.json();
+        const bodyChallenge = await resChallenge.text();
 
-        if (!resChallenge.ok) throw new Error(dataChallenge.error);
+        if (!resChallenge.ok) throw new Error(JSON.parse(bodyChallenge).error);
 
-        const challenge = BigInt(dataChallenge.challenge);
-        log(`Challenge Received: ${challenge.toString().substring(0, 16)}...`);
+        const challenge = challengeDigits(bodyChallenge);
+        if (!challenge) throw new Error('Malformed challenge response');
+        log(`Challenge Received: ${challenge.substring(0, 16)}...`);
 
-        // Step B: Calculate Proof (C^x mod P)
+        // Step B: Calculate Proof (C^x mod P) in the worker
         log('Calculating Proof (C^x mod P)...');
-        const proof = modPow(challenge, currentMasterKey, P);
-        log(`Proof Generated: ${proof.toString().substring(0, 16)}...`);
+        const proof = await zkp.proof(currentMasterKey, challenge);
+        log(`Proof Generated: ${proof.substring(0, 16)}...`);
 
         // Step C: Verify
         log('Sending Proof to Server...');
@@ -143,8 +170,9 @@ document.getElementById('btn-login').addEventListener('click', async () => {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 user_id: userId,
-                challenge: challenge.toString(),
-                proof: proof.toString()
+                challenge: challenge,
+                proof: proof,
+                device_id: localStorage.getItem(`sdi_l_device_${userId}`)
             })
         });
         const dataVerify = await resVerify.json();
@@ -194,7 +222,7 @@ document.getElementById('btn-revoke').addEventListener('click', async () => {
         const res = await fetch('/revoke_session', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ user_id: activeSessionToken.user_id })
+            body: JSON.stringify({ user_id: activeSessionToken.user_id, token_id: activeSessionToken.token_id })
         });
         if (res.ok) {
             log('Session Revoked.', 'info');
@@ -206,4 +234,8 @@ document.getElementById('btn-revoke').addEventListener('click', async () => {
 
 // Tab Listeners
 tabs.register.onclick = () => showView('register');
-tabs.login.onclick = () => showView('login');
+tabs.login.onclick = () => {
+    showView('login');
+    preloadKey(document.getElementById('login-user-id').value.trim());
+};
+document.getElementById('login-user-id').addEventListener('change', e => preloadKey(e.target.value.trim()));
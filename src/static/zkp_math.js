@@ -0,0 +1,74 @@
+// Modular arithmetic for the ZKP client, shared by the page, zkp_worker.js
+// and benchmarks/bench_modpow.js (loaded with require there).
+(function (root) {
+    const P = 2n ** 256n - 189n;
+    const C = 189n;
+    const LOW = (1n << 256n) - 1n;
+    const WINDOW = 5;
+
+    // x mod P for 0 <= x < P^2. P is 2^256 - 189, so the high half folds back
+    // in as high * 189: two shift/mask folds and one subtraction instead of a
+    // BigInt division per step.
+    function reduce(x) {
+        x = (x >> 256n) * C + (x & LOW);
+        x = (x >> 256n) * C + (x & LOW);
+        return x >= P ? x - P : x;
+    }
+
+    // Sliding-window recoding of an exponent, most significant bits first:
+    // each step squares `shift` times and then multiplies by base^digit (digit
+    // odd). Depends only on the key, so it can be computed before a challenge.
+    function recode(exponent) {
+        const bits = exponent.toString(2);
+        const steps = [];
+        let i = 0;
+        let pending = 0;
+        while (i < bits.length) {
+            if (bits[i] === '0') {
+                pending++;
+                i++;
+                continue;
+            }
+            let j = Math.min(i + WINDOW, bits.length);
+            while (bits[j - 1] === '0') j--;
+            steps.push([pending + j - i, parseInt(bits.slice(i, j), 2)]);
+            pending = 0;
+            i = j;
+        }
+        return { steps, trailing: pending };
+    }
+
+    // base^exponent mod P; exponent is a BigInt or the result of recode().
+    function powModP(base, exponent) {
+        const plan = typeof exponent === 'bigint' ? recode(exponent) : exponent;
+        base %= P;
+        const square = reduce(base * base);
+        const odd = [base];  // base^1, base^3, ..., base^(2^WINDOW - 1)
+        for (let k = 1; k < 1 << (WINDOW - 1); k++) odd.push(reduce(odd[k - 1] * square));
+
+        let result = 1n;
+        plan.steps.forEach(([shift, digit], n) => {
+            if (n === 0) {
+                result = odd[digit >> 1];
+                return;
+            }
+            for (let s = 0; s < shift; s++) result = reduce(result * result);
+            result = reduce(result * odd[digit >> 1]);
+        });
+        for (let s = 0; s < plan.trailing; s++) result = reduce(result * result);
+        return result;
+    }
+
+    // Uniform in [1, P); randomBytes(n) returns a Uint8Array of n random bytes.
+    function generateMasterKey(randomBytes) {
+        for (;;) {
+            const hex = Array.from(randomBytes(32), b => b.toString(16).padStart(2, '0')).join('');
+            const key = BigInt('0x' + hex);
+            if (key > 0n && key < P) return key;
+        }
+    }
+
+    const api = { P, reduce, recode, powModP, generateMasterKey };
+    if (typeof module !== 'undefined' && module.exports) module.exports = api;
+    else root.SDILMath = api;
+})(this);
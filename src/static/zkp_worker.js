@@ -0,0 +1,36 @@
+// Key generation and proofs for script.js, off the page's main thread.
+importScripts('zkp_math.js');
+
+const randomBytes = n => crypto.getRandomValues(new Uint8Array(n));
+let nextKey = SDILMath.generateMasterKey(randomBytes);  // ready before registration asks for it
+const plans = new Map();  // key (decimal string) -> SDILMath.recode(key)
+
+function plan(key) {
+    let recoded = plans.get(key);
+    if (!recoded) {
+        recoded = SDILMath.recode(BigInt(key));
+        plans.set(key, recoded);
+    }
+    return recoded;
+}
+
+self.onmessage = ({ data }) => {
+    const { id, op } = data;
+    try {
+        let result;
+        if (op === 'keygen') {
+            result = nextKey.toString();
+            nextKey = SDILMath.generateMasterKey(randomBytes);
+        } else if (op === 'load') {
+            plan(data.key);
+            result = true;
+        } else if (op === 'proof') {
+            result = SDILMath.powModP(BigInt(data.challenge), plan(data.key)).toString();
+        } else {
+            throw new Error(`Unknown operation: ${op}`);
+        }
+        self.postMessage({ id, result });
+    } catch (e) {
+        self.postMessage({ id, error: e.message });
+    }
+};
@@ -0,0 +1,406 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from records import Session
+
+SCHEMA_VERSION = 2
+SESSION_COLUMNS = 'token_id, user_id, device_id, issued_at, expires_at'
+KEY_SIZE = 32  # public_ver_key < P < 2**256, stored big-endian
+TOKEN_SIZE = 16  # token ids are random bytes, hex-encoded outside the store
+
+log = logging.getLogger('sdil.storage')
+
+# WITHOUT ROWID keeps each row in its primary-key b-tree instead of a rowid
+# table plus a duplicate index on the key.
+DEVICES_TABLE = '''
+    CREATE TABLE {name} (
+        user_id TEXT,
+        device_id TEXT,
+        public_ver_key BLOB,
+        PRIMARY KEY (user_id, device_id)
+    ) WITHOUT ROWID
+'''
+SESSIONS_TABLE = '''
+    CREATE TABLE {name} (
+        token_id BLOB PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        device_id TEXT,
+        issued_at REAL,
+        expires_at REAL
+    ) WITHOUT ROWID
+'''
+
+
+def encode_key(value):
+    return value.to_bytes(KEY_SIZE, 'big')
+
+
+def decode_key(blob):
+    return int.from_bytes(blob, 'big')
+
+
+def _key_blob(key):
+    # v0 stored keys as decimal TEXT without checking them; ones that are not
+    # a positive integer of at most KEY_SIZE bytes cannot be stored in v2.
+    try:
+        value = int(key)
+    except (TypeError, ValueError):
+        return None
+    return encode_key(value) if 0 < value < 1 << (8 * KEY_SIZE) else None
+
+
+def _token_blob(token_id):
+    # Token ids are TOKEN_SIZE random bytes, hex-encoded outside the store.
+    try:
+        return bytes.fromhex(token_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _session(row):
+    return Session(row[0].hex(), *row[1:])
+
+
+def _session_row(session):
+    return (bytes.fromhex(session.token_id), session.user_id, session.device_id,
+            session.issued_at, session.expires_at)
+
+
+class SQLiteStore:
+    """Row-level persistence for Server_Srav on one long-lived WAL connection."""
+
+    def __init__(self, db_path="sdi_l.db", metrics=None):
+        self.db_path = db_path
+        self.metrics = metrics
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self._depth = 0
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._init_db()
+
+    def _init_db(self):
+        with self.transaction() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            migrate = version < SCHEMA_VERSION and bool(tables)
+            if migrate:
+                self._migrate(conn, tables)
+            conn.execute(DEVICES_TABLE.format(name='IF NOT EXISTS user_devices'))
+            conn.execute(SESSIONS_TABLE.format(name='IF NOT EXISTS active_sessions'))
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON active_sessions (user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_device ON active_sessions (device_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON active_sessions (expires_at)')
+            # subject is 'user:<user_id>', 'device:<device_id>' or 'token:<token_id>'
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS revocations (
+                    subject TEXT PRIMARY KEY,
+                    revoked_at REAL
+                )
+            ''')
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        if migrate:
+            # Give the space of the old TEXT/JSON rows back to the filesystem.
+            self.conn.execute('VACUUM')
+
+    def _migrate(self, conn, tables):
+        # v0 kept decimal TEXT keys and one JSON token per user_id; v1 keyed
+        # sessions by hex token_id. Both are rewritten into the v2 layout.
+        conn.create_function('key_blob', 1, _key_blob, deterministic=True)
+        conn.create_function('token_blob', 1, _token_blob, deterministic=True)
+        if 'user_devices' in tables:
+            conn.execute('ALTER TABLE user_devices RENAME TO user_devices_old')
+            conn.execute(DEVICES_TABLE.format(name='user_devices'))
+            copied = conn.execute('''
+                INSERT INTO user_devices SELECT * FROM (
+                    SELECT user_id, device_id, key_blob(public_ver_key) AS key FROM user_devices_old
+                ) WHERE key IS NOT NULL
+            ''').rowcount
+            skipped = conn.execute('SELECT COUNT(*) FROM user_devices_old').fetchone()[0] - copied
+            if skipped:
+                log.warning("Skipped %d device(s) with an invalid public_ver_key while migrating %s",
+                            skipped, self.db_path)
+            conn.execute('DROP TABLE user_devices_old')
+        if 'active_sessions' in tables:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(active_sessions)')}
+            for index in ('idx_sessions_token_id', 'idx_sessions_user', 'idx_sessions_device',
+                          'idx_sessions_expires_at'):
+                conn.execute(f'DROP INDEX IF EXISTS {index}')
+            conn.execute('ALTER TABLE active_sessions RENAME TO active_sessions_old')
+            conn.execute(SESSIONS_TABLE.format(name='active_sessions'))
+            if 'token_json' in columns:
+                source = '''
+                    SELECT token_blob(json_extract(token_json, '$.token_id')) AS token, user_id,
+                           json_extract(token_json, '$.device_used'),
+                           json_extract(token_json, '$.issued_at'),
+                           json_extract(token_json, '$.expires_at')
+                    FROM active_sessions_old
+                '''
+            else:
+                source = '''
+                    SELECT token_blob(token_id) AS token, user_id, device_id, issued_at, expires_at
+                    FROM active_sessions_old
+                '''
+            conn.execute(f'INSERT OR IGNORE INTO active_sessions SELECT * FROM ({source}) WHERE token IS NOT NULL')
+            conn.execute('DROP TABLE active_sessions_old')
+        if 'revoked_users' in tables:
+            conn.execute('CREATE TABLE IF NOT EXISTS revocations (subject TEXT PRIMARY KEY, revoked_at REAL)')
+            conn.execute("INSERT OR REPLACE INTO revocations SELECT 'user:' || user_id, revoked_at FROM revoked_users")
+            conn.execute('DROP TABLE revoked_users')
+
+    @contextmanager
+    def transaction(self):
+        # Nested calls join the outermost transaction, so callers can group
+        # several row writes into a single commit.
+        with self.lock:
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                if self._depth == 1:
+                    self.conn.rollback()
+                raise
+            else:
+                if self._depth == 1:
+                    self._commit()
+            finally:
+                self._depth -= 1
+
+    def _commit(self):
+        if not self.conn.in_transaction:
+            return  # nothing was written, so there is no commit to time
+        if self.metrics is None:
+            self.conn.commit()
+            return
+        start = time.perf_counter()
+        self.conn.commit()
+        self.metrics.observe('sdil_db_commit_seconds', time.perf_counter() - start)
+
+    def load_devices(self):
+        with self.lock:
+            cursor = self.conn.execute('SELECT user_id, device_id, public_ver_key FROM user_devices')
+            for user_id, device_id, key in cursor:
+                yield user_id, device_id, decode_key(key)
+
+    def iter_devices(self, page_size=50000):
+        # Keyset pagination: memory stays at one page and the lock is released
+        # between pages, so a live server keeps serving during an export.
+        after = ('', '')
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    'SELECT user_id, device_id, public_ver_key FROM user_devices '
+                    'WHERE (user_id, device_id) > (?, ?) ORDER BY user_id, device_id LIMIT ?',
+                    after + (page_size,)).fetchall()
+            for user_id, device_id, key in rows:
+                yield user_id, device_id, decode_key(key)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][:2]
+
+    def load_sessions(self):
+        with self.lock:
+            for row in self.conn.execute(f'SELECT {SESSION_COLUMNS} FROM active_sessions'):
+                yield _session(row)
+
+    def get_devices(self, user_id):
+        with self.lock:
+            rows = self.conn.execute('SELECT device_id, public_ver_key FROM user_devices WHERE user_id = ?',
+                                     (user_id,)).fetchall()
+        return [{'device_id': device_id, 'public_ver_key': decode_key(key)} for device_id, key in rows]
+
+    def get_session(self, token_id):
+        with self.lock:
+            row = self.conn.execute(f'SELECT {SESSION_COLUMNS} FROM active_sessions WHERE token_id = ?',
+                                    (_token_blob(token_id),)).fetchone()
+        return _session(row) if row else None
+
+    def get_user_sessions(self, user_id):
+        with self.lock:
+            rows = self.conn.execute(f'SELECT {SESSION_COLUMNS} FROM active_sessions WHERE user_id = ?',
+                                     (user_id,)).fetchall()
+        return [_session(row) for row in rows]
+
+    def get_device_sessions(self, device_id):
+        with self.lock:
+            rows = self.conn.execute(f'SELECT {SESSION_COLUMNS} FROM active_sessions WHERE device_id = ?',
+                                     (device_id,)).fetchall()
+        return [_session(row) for row in rows]
+
+    def add_device(self, user_id, device_id, public_ver_key):
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO user_devices VALUES (?, ?, ?)',
+                         (user_id, device_id, encode_key(public_ver_key)))
+
+    def add_devices(self, rows):
+        # rows are (user_id, device_id, public_ver_key); one transaction per
+        # call. Rows already present are skipped; returns how many were inserted.
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO user_devices VALUES (?, ?, ?)',
+                             ((user_id, device_id, encode_key(key)) for user_id, device_id, key in rows))
+            return conn.total_changes - before
+
+    def delete_user(self, user_id):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM user_devices WHERE user_id = ?', (user_id,))
+            conn.execute('DELETE FROM active_sessions WHERE user_id = ?', (user_id,))
+
+    def put_session(self, session):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO active_sessions VALUES (?, ?, ?, ?, ?)', _session_row(session))
+
+    def _delete_sessions_where(self, clause, args):
+        with self.transaction() as conn:
+            rows = conn.execute(f'DELETE FROM active_sessions WHERE {clause} RETURNING {SESSION_COLUMNS}',
+                                args).fetchall()
+        return [_session(row) for row in rows]
+
+    def delete_session(self, token_id):
+        deleted = self._delete_sessions_where('token_id = ?', (_token_blob(token_id),))
+        return deleted[0] if deleted else None
+
+    def delete_user_sessions(self, user_id):
+        return self._delete_sessions_where('user_id = ?', (user_id,))
+
+    def delete_device_sessions(self, device_id):
+        return self._delete_sessions_where('device_id = ?', (device_id,))
+
+    def delete_sessions(self, token_ids):
+        if not token_ids:
+            return
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM active_sessions WHERE token_id = ?', ((_token_blob(t),) for t in token_ids))
+
+    def delete_expired_sessions(self, now):
+        with self.transaction() as conn:
+            return conn.execute('DELETE FROM active_sessions WHERE expires_at < ?', (now,)).rowcount
+
+    def count_sessions(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM active_sessions').fetchone()[0]
+
+    def load_revocations(self, since):
+        with self.lock:
+            return self.conn.execute('SELECT subject, revoked_at FROM revocations WHERE revoked_at >= ?',
+                                     (since,)).fetchall()
+
+    def get_revocations(self, subjects):
+        # {subject: revoked_at} for those of subjects that are revoked.
+        with self.lock:
+            return dict(self.conn.execute(
+                f'SELECT subject, revoked_at FROM revocations WHERE subject IN ({", ".join("?" * len(subjects))})',
+                subjects).fetchall())
+
+    def put_revocation(self, subject, revoked_at):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO revocations VALUES (?, ?)', (subject, revoked_at))
+
+    def delete_revocations(self, subjects):
+        if not subjects:
+            return
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM revocations WHERE subject = ?', ((s,) for s in subjects))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class StoreSessions:
+    """SessionIndex interface served straight from the active_sessions table."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def add(self, session):
+        self.store.put_session(session)
+
+    def get(self, token_id):
+        return self.store.get_session(token_id)
+
+    def for_user(self, user_id):
+        return self.store.get_user_sessions(user_id)
+
+    def pop(self, token_id):
+        return self.store.delete_session(token_id)
+
+    def pop_user(self, user_id):
+        return self.store.delete_user_sessions(user_id)
+
+    def pop_device(self, device_id):
+        return self.store.delete_device_sessions(device_id)
+
+    def __len__(self):
+        return self.store.count_sessions()
+
+
+class DeviceCache:
+    """Bounded LRU of per-user device lists, filled from the store on demand."""
+
+    def __init__(self, store, capacity=100000):
+        self.store = store
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, default=None):
+        with self.lock:
+            devices = self._entries.get(user_id)
+            if devices is not None:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+                devices = self.store.get_devices(user_id)
+                if self.capacity:
+                    self._entries[user_id] = devices
+                    if len(self._entries) > self.capacity:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+        return devices if devices else default
+
+    def setdefault(self, user_id, default):
+        # capacity=0 disables caching: every get reads through to the store.
+        with self.lock:
+            devices = self.get(user_id)
+            if devices is None:
+                devices = default
+                if self.capacity:
+                    self._entries[user_id] = devices
+            return devices
+
+    def add(self, user_id, device, unique=False):
+        with self.lock:
+            devices = self.setdefault(user_id, [])
+            if unique and any(d['device_id'] == device['device_id'] for d in devices):
+                return False
+            devices.append(device)
+        return True
+
+    def pop(self, user_id, default=None):
+        with self.lock:
+            return self._entries.pop(user_id, default)
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __getitem__(self, user_id):
+        devices = self.get(user_id)
+        if devices is None:
+            raise KeyError(user_id)
+        return devices
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._entries), 'capacity': self.capacity}
@@ -2,26 +2,44 @@ import getpass
 import secrets
 from cryptography.hazmat.primitives.asymmetric import ec
 
+KEY_SIZE = 32  # bytes per key in HeadlessWallet's keystore; every key is < P < 2**256
+
+
+def prompt_pin():
+    # Unlock policies are callables returning True to release the master key.
+    return getpass.getpass("Enter PIN for biometric unlock: ") == "1234"
+
+
+def always_unlock():
+    return True
+
+
 class SDILWallet:
-    def __init__(self):
+    def __init__(self, executor=None, unlock_policy=prompt_pin):
+        self.executor = executor  # Optional CryptoExecutor for the exponentiations
+        self.unlock_policy = unlock_policy
         self.master_key = None
         self.public_ver_key = None
         self.P = 2**256 - 189  # Prime Modulus (Shared Constant)
         self.G = 3            # Public Base (Generator - Shared Constant)
 
+    def _pow(self, base, exponent, modulus):
+        if self.executor is not None:
+            return self.executor.pow(base, exponent, modulus)
+        return pow(base, exponent, modulus)
+
     def generate_keys(self):
         # Generate a secure, large random integer for the private master key (x)
         self.master_key = secrets.randbelow(self.P)
         
         # Calculate the Public Verification Key (Y = G^x mod P)
-        self.public_ver_key = pow(self.G, self.master_key, self.P)
+        self.public_ver_key = self._pow(self.G, self.master_key, self.P)
         
         print("Keys generated – Master key (x) local. Public key (Y) ready for server.")
 
     def biometric_unlock(self):
-        # Biometric unlock mock remains a simple PIN check
-        pin = getpass.getpass("Enter PIN for biometric unlock: ")
-        if pin == "1234":
+        # Biometric unlock mock remains a simple PIN check unless another policy is plugged in
+        if self.unlock_policy():
             if self.master_key is None:
                 raise ValueError("Generate keys first!")
             print("Biometric unlock success – Master key (x) accessed.")
@@ -34,12 +52,85 @@ class SDILWallet:
         if self.master_key is None:
             raise ValueError("Unlock wallet first!")
         
-        proof = pow(challenge, self.master_key, self.P)
+        proof = self._pow(challenge, self.master_key, self.P)
         
         if not suppress_output: 
             print(f"ZKP Proof generated for challenge {challenge} (Proof: {proof}).")
             
         return proof
 
+
+class HeadlessWallet:
+    """Many synthetic identities without a terminal, for load tests and service identities.
+
+    Master and public keys live in two bytearrays at 32 bytes per identity
+    (instead of two int objects each), indexed by identity number. Keys and
+    proofs are produced in batches, through the CryptoExecutor's process
+    pool when one is given.
+    """
+
+    def __init__(self, executor=None, unlock_policy=always_unlock, prefix="synthetic"):
+        self.executor = executor
+        self.unlock_policy = unlock_policy
+        self.prefix = prefix
+        self.P = 2**256 - 189
+        self.G = 3
+        self.master_keys = bytearray()
+        self.public_keys = bytearray()
+        self.unlocked = False
+
+    def __len__(self):
+        return len(self.master_keys) // KEY_SIZE
+
+    def _pow_all(self, bases, exponents):
+        if self.executor is not None:
+            return self.executor.map(pow, bases, exponents, [self.P] * len(bases))
+        return [pow(base, exponent, self.P) for base, exponent in zip(bases, exponents)]
+
+    def _get(self, keys, index):
+        if not 0 <= index < len(self):
+            raise IndexError(f"No identity {index} in wallet")
+        return int.from_bytes(keys[index * KEY_SIZE:(index + 1) * KEY_SIZE], 'big')
+
+    def user_id(self, index):
+        return f"{self.prefix}-{index}"
+
+    def generate_keys(self, count):
+        # Returns the indices of the new identities.
+        start = len(self)
+        master_keys = [secrets.randbelow(self.P - 1) + 1 for _ in range(count)]
+        public_keys = self._pow_all([self.G] * count, master_keys)
+        for master_key, public_key in zip(master_keys, public_keys):
+            self.master_keys += master_key.to_bytes(KEY_SIZE, 'big')
+            self.public_keys += public_key.to_bytes(KEY_SIZE, 'big')
+        return range(start, start + count)
+
+    def master_key(self, index):
+        return self._get(self.master_keys, index)
+
+    def public_ver_key(self, index):
+        return self._get(self.public_keys, index)
+
+    def registrations(self, indices=None):
+        # (line_number, user_id, public_ver_key, device_id) records for
+        # Server_Srav.import_devices. Like main.py, the PoC registers the
+        # master key (x) as the verification key.
+        for index in range(len(self)) if indices is None else indices:
+            yield index, self.user_id(index), self.master_key(index), None
+
+    def unlock(self):
+        if not self.unlock_policy():
+            raise ValueError("Unlock policy refused – Access denied.")
+        self.unlocked = True
+
+    def lock(self):
+        self.unlocked = False
+
+    def generate_zkp_proofs(self, indices, challenges):
+        if not self.unlocked:
+            raise ValueError("Unlock wallet first!")
+        return self._pow_all(list(challenges), [self.master_key(index) for index in indices])
+
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
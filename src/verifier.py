@@ -0,0 +1,70 @@
+class ProofVerifier:
+    """Finds which registered device produced proof == challenge^key mod P.
+
+    With a device hint only that device is checked. Otherwise users with
+    table_threshold or more devices share one fixed-base window table built
+    for the challenge, so each extra device costs a few dozen modular
+    multiplications instead of a full exponentiation.
+    """
+
+    def __init__(self, P, window=4, table_threshold=16):
+        self.P = P
+        self.window = window
+        self.table_threshold = table_threshold
+        self.windows = -(-P.bit_length() // window)
+        self.max_exponent = 1 << (self.windows * window)
+
+    def build_table(self, base):
+        P = self.P
+        table = []
+        b = base % P
+        for _ in range(self.windows):
+            row = [1, b]
+            for _ in range((1 << self.window) - 2):
+                row.append(row[-1] * b % P)
+            table.append(row)
+            b = row[-1] * b % P
+        return table
+
+    def fixed_base_pow(self, table, exponent):
+        P = self.P
+        mask = (1 << self.window) - 1
+        result = 1
+        for row in table:
+            if not exponent:
+                break
+            digit = exponent & mask
+            if digit:
+                result = result * row[digit] % P
+            exponent >>= self.window
+        return result
+
+    def match(self, challenge, proof, devices, device_id=None):
+        P = self.P
+        if device_id is not None:
+            for device in devices:
+                if device['device_id'] == device_id:
+                    return device_id if pow(challenge, device['public_ver_key'], P) == proof else None
+            return None
+
+        if len(devices) < self.table_threshold:
+            for device in devices:
+                if pow(challenge, device['public_ver_key'], P) == proof:
+                    return device['device_id']
+            return None
+
+        table = self.build_table(challenge)
+        for device in devices:
+            key = device['public_ver_key']
+            if 0 <= key < self.max_exponent:
+                expected_proof = self.fixed_base_pow(table, key)
+            else:
+                expected_proof = pow(challenge, key, P)
+            if expected_proof == proof:
+                return device['device_id']
+        return None
+
+
+def match_device(P, challenge, proof, devices, device_id=None):
+    # Module-level entry point so batch verification can run in a process pool.
+    return ProofVerifier(P).match(challenge, proof, devices, device_id)
@@ -1 +1,661 @@
- 
+import io
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import bulk
+import instagram_server
+import listing
+import logs
+from backends import SharedTableFull, make_backend
+from crypto_executor import CryptoExecutor
+from journal import make_store
+from metrics import Metrics
+from ratelimit import RateLimited, TokenBucketLimiter
+from records import Challenge, Session, ShardedDevices, ShardedSessionIndex
+from server_srav import Server_Srav
+from signed_tokens import TokenSigner
+from user_device import HeadlessWallet, SDILWallet
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sdi_l.db")
+
+
+def login(server, user_id, key):
+    challenge = server.generate_challenge(user_id)
+    return server.verify_zkp_proof(user_id, challenge, pow(challenge, key, server.P))
+
+
+def test_login_persists_session_and_devices(db_path):
+    server = Server_Srav(db_path)
+    server.register_device("alice", 12345, suppress_output=True)
+    verified, token = login(server, "alice", 12345)
+    assert verified
+
+    restarted = Server_Srav(db_path)
+    assert restarted.get_registered_devices("alice") == server.get_registered_devices("alice")
+    assert restarted.validate_session("alice", token)
+
+
+def test_revoke_deletes_only_that_session(db_path):
+    server = Server_Srav(db_path)
+    for user_id, key in (("alice", 11), ("bob", 22)):
+        server.register_device(user_id, key, suppress_output=True)
+        login(server, user_id, key)
+    assert server.revoke_session("alice")
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT user_id FROM active_sessions').fetchall() == [("bob",)]
+    assert conn.execute('SELECT COUNT(*) FROM user_devices').fetchone() == (2,)
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ("wal",)
+
+
+def test_lazy_server_reads_through_device_cache(db_path):
+    Server_Srav(db_path).register_device("alice", 12345, suppress_output=True)
+
+    server = Server_Srav(db_path, lazy=True, cache_size=1)
+    assert len(server.sessions) == 0 and len(server.user_devices) == 0
+    verified, token = login(server, "alice", 12345)
+    assert verified
+    assert server.validate_session("alice", token)
+    assert server.get_registered_devices("bob") == []
+    assert server.cache_stats()['evictions'] == 1
+    assert server.get_registered_devices("alice")
+    assert server.revoke_session("alice")
+    assert not server.validate_session("alice", token)
+
+
+def test_devices_hold_concurrent_sessions_and_revoke_in_bulk(db_path):
+    server = Server_Srav(db_path)
+    phone = server.register_device("alice", 11, suppress_output=True)
+    laptop = server.register_device("alice", 22, suppress_output=True)
+    server.register_device("bob", 33, suppress_output=True)
+
+    # Challenges issued to both devices are pending at once.
+    first, second = server.generate_challenge("alice"), server.generate_challenge("alice")
+    with pytest.raises(ValueError, match="No active challenge for bob!"):
+        server.verify_zkp_proof("bob", first, pow(first, 33, server.P))
+    _, from_phone = server.verify_zkp_proof("alice", first, pow(first, 11, server.P), phone)
+    _, from_laptop = server.verify_zkp_proof("alice", second, pow(second, 22, server.P), laptop)
+    _, again = login(server, "alice", 11)
+    _, bob = login(server, "bob", 33)
+    assert {t['token_id'] for t in server.get_sessions("alice")} == {
+        from_phone['token_id'], from_laptop['token_id'], again['token_id']}
+
+    assert server.revoke_session("alice", from_laptop['token_id'])
+    assert not server.revoke_session("bob", from_phone['token_id'])
+    assert not server.validate_session("alice", from_laptop)
+    assert server.revoke_device_sessions("alice", phone)
+    assert not server.validate_session("alice", from_phone) and not server.validate_session("alice", again)
+    assert server.store.get_user_sessions("alice") == []
+
+    _, from_laptop = login(server, "alice", 22)
+    assert server.revoke_session("alice")
+    assert not server.validate_session("alice", from_laptop)
+    assert server.validate_session("bob", bob) and Server_Srav(db_path).validate_session("bob", bob)
+
+
+def test_store_migrates_text_keys_and_json_sessions(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE user_devices (user_id TEXT, device_id TEXT, public_ver_key TEXT, '
+                 'PRIMARY KEY (user_id, device_id))')
+    conn.execute('INSERT INTO user_devices VALUES (?, ?, ?)', ("alice", "d1", str(2**255 + 11)))
+    conn.execute('CREATE TABLE active_sessions (user_id TEXT PRIMARY KEY, token_json TEXT)')
+    conn.execute('CREATE TABLE revoked_users (user_id TEXT PRIMARY KEY, revoked_at REAL)')
+    token = {'user_id': "alice", 'token_id': "ab" * 16, 'issued_at': time.time(),
+             'expires_at': time.time() + 60, 'device_used': "d1"}
+    conn.execute('INSERT INTO active_sessions VALUES (?, ?)', ("alice", json.dumps(token)))
+    conn.execute('INSERT INTO revoked_users VALUES (?, ?)', ("bob", 1.0))
+    conn.commit()
+    conn.close()
+
+    server = Server_Srav(db_path)
+    assert server.user_devices["alice"] == [{'device_id': "d1", 'public_ver_key': 2**255 + 11}]
+    assert server.validate_session("alice", token)
+    assert server.store.get_device_sessions("d1")[0].token_id == token['token_id']
+    assert server.store.load_revocations(0) == [("user:bob", 1.0)]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('PRAGMA user_version').fetchone() == (2,)
+    assert conn.execute('SELECT length(public_ver_key), length(token_id) '
+                        'FROM user_devices, active_sessions').fetchone() == (32, 16)
+
+
+def test_store_migration_skips_keys_that_do_not_fit(db_path, caplog):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE user_devices (user_id TEXT, device_id TEXT, public_ver_key TEXT, '
+                 'PRIMARY KEY (user_id, device_id))')
+    conn.executemany('INSERT INTO user_devices VALUES (?, ?, ?)', [
+        ("user123", "028b89c8f4efbf64", str(2**382 + 5)), ("user123", "4023b9b1c9c44a63", "12345"),
+        ("bob", "d2", "-7"), ("bob", "d3", "0"), ("bob", "d4", "not a key")])
+    conn.commit()
+    conn.close()
+
+    with caplog.at_level(logging.WARNING, logger='sdil.storage'):
+        server = Server_Srav(db_path)
+    assert server.user_devices["user123"] == [{'device_id': "4023b9b1c9c44a63", 'public_ver_key': 12345}]
+    assert "bob" not in server.user_devices
+    assert "Skipped 4 device(s)" in caplog.text
+
+
+def test_verify_with_device_hint_and_fixed_base_table(db_path):
+    server = Server_Srav(db_path)
+    keys = [secrets.randbelow(server.P) for _ in range(server.verifier.table_threshold + 2)]
+    device_ids = [server.register_device("alice", key, suppress_output=True) for key in keys]
+
+    challenge = server.generate_challenge("alice")
+    proof = pow(challenge, keys[-1], server.P)
+    assert server.verify_zkp_proof("alice", challenge, proof, device_ids[0]) == (False, None)
+    verified, token = server.verify_zkp_proof("alice", challenge, proof, device_ids[-1])
+    assert verified and token['device_used'] == device_ids[-1]
+
+    verified, token = login(server, "alice", keys[-2])
+    assert verified and token['device_used'] == device_ids[-2]
+    challenge = server.generate_challenge("alice")
+    assert server.verify_zkp_proof("alice", challenge, pow(challenge, keys[-1], server.P) + 1) == (False, None)
+
+
+def test_verify_batch_matches_single_item_semantics(db_path):
+    executor = CryptoExecutor(workers=2)
+    server = Server_Srav(db_path, executor=executor)
+    for user_id, key in (("alice", 11), ("bob", 22), ("carol", 33)):
+        server.register_device(user_id, key, suppress_output=True)
+    alice = server.generate_challenge("alice")
+    bob = server.generate_challenge("bob")
+    server.challenges[Challenge.id_for(bob)].issued_at -= server.TTL + 1
+
+    results = server.verify_zkp_proof_batch([
+        ("alice", alice, pow(alice, 11, server.P)),
+        ("alice", alice, pow(alice, 11, server.P)),
+        ("bob", bob, pow(bob, 22, server.P)),
+        ("carol", 5, 5),
+        ("dave", 5, 5),
+    ])
+    executor.shutdown()
+
+    assert results[0][0] and results[0][1]['user_id'] == "alice"
+    assert results[2] == (False, None, None)
+    assert [(verified, token, str(error)) for verified, token, error in (results[1], results[3], results[4])] == [
+        (False, None, "No active challenge for alice!"),
+        (False, None, "No active challenge for carol!"),
+        (False, None, "No devices registered for dave!")]
+    assert Server_Srav(db_path).validate_session("alice", results[0][1])
+
+
+def test_wallet_and_server_share_crypto_executor(db_path):
+    executor = CryptoExecutor(workers=2)
+    wallet = SDILWallet(executor)
+    wallet.generate_keys()
+    assert wallet.public_ver_key == pow(wallet.G, wallet.master_key, wallet.P)
+
+    server = Server_Srav(db_path, executor=executor)
+    device_id = server.register_device("alice", wallet.master_key, suppress_output=True)
+    challenge = server.generate_challenge("alice")
+    verified, _ = server.verify_zkp_proof("alice", challenge, wallet.generate_zkp_proof(challenge, True))
+    assert verified
+    # One candidate device is matched inline; only multi-device scans go to the pool.
+    assert executor.stats()['submitted'] == 2
+
+    server.register_device("alice", 11, suppress_output=True)
+    for hint in (None, device_id):
+        challenge = server.generate_challenge("alice")
+        assert server.verify_zkp_proof("alice", challenge, wallet.generate_zkp_proof(challenge, True), hint)[0]
+
+    stats = executor.stats()
+    executor.shutdown()
+    assert stats['submitted'] == stats['completed'] == 5
+    assert stats['queue_depth'] == 0
+
+
+def test_headless_wallet_logs_in_many_identities_in_batches(db_path):
+    locked = SDILWallet(unlock_policy=lambda: False)
+    locked.generate_keys()
+    with pytest.raises(ValueError, match="Access denied"):
+        locked.biometric_unlock()
+
+    wallet = HeadlessWallet(unlock_policy=lambda: False)
+    indices = wallet.generate_keys(40)
+    assert len(wallet) == 40 and len(wallet.master_keys) == 40 * 32
+    assert wallet.public_ver_key(7) == pow(wallet.G, wallet.master_key(7), wallet.P)
+    with pytest.raises(ValueError):
+        wallet.unlock()
+    with pytest.raises(ValueError, match="Unlock wallet first!"):
+        wallet.generate_zkp_proofs(indices, [5] * 40)
+
+    server = Server_Srav(db_path)
+    assert server.import_devices(wallet.registrations())['imported'] == 40
+    wallet.unlock_policy = lambda: True
+    wallet.unlock()
+    challenges = [server.generate_challenge(wallet.user_id(i)) for i in indices]
+    proofs = wallet.generate_zkp_proofs(indices, challenges)
+    results = server.verify_zkp_proof_batch(
+        [(wallet.user_id(i), c, p) for i, c, p in zip(indices, challenges, proofs)])
+    assert all(verified for verified, _, _ in results)
+
+
+def test_challenges_are_bounded_single_use_and_rate_limited(db_path):
+    limiter = TokenBucketLimiter(rate=1.0, burst=3)
+    server = Server_Srav(db_path, backend=make_backend('memory', max_challenges=2), challenge_limiter=limiter)
+    server.register_device("alice", 11, suppress_output=True)
+    oldest, *recent = [server.generate_challenge("alice") for _ in range(3)]
+    with pytest.raises(RateLimited):
+        server.generate_challenge("alice")
+
+    # The oldest challenge was evicted when the third was issued.
+    with pytest.raises(ValueError, match="No active challenge"):
+        server.verify_zkp_proof("alice", oldest, pow(oldest, 11, server.P))
+    assert server.verify_zkp_proof("alice", recent[0], pow(recent[0], 11, server.P))[0]
+    with pytest.raises(ValueError, match="No active challenge"):
+        server.verify_zkp_proof("alice", recent[0], pow(recent[0], 11, server.P))
+    assert server.challenge_stats() == {'issued': 3, 'rate_limited': 1, 'replays_rejected': 2,
+                                        'pending': 1, 'evicted': 1}
+
+    assert [limiter.allow("carol", now=100.0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("carol", now=101.0) and not limiter.allow("carol", now=101.5)
+
+
+def test_verbose_server_logs_through_the_core_and_quiet_mode_writes_nothing(db_path):
+    handlers = list(logging.getLogger('sdil').handlers)
+    server = instagram_server.Server_Srav(db_path)
+    assert logging.getLogger('sdil').handlers == handlers
+
+    verbose = io.StringIO()
+    close = logs.configure(logging.DEBUG, verbose, 'async')
+    server.register_device("alice", 11)
+    challenge = server.generate_challenge("alice")
+    verified, token = server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))
+    assert verified and server.validate_session("alice", token)
+    assert server.revoke_session("alice")
+    close()
+    output = verbose.getvalue()
+    assert f"Challenge generated for alice: {challenge}" in output
+    assert "ZKP verification success for alice" in output and "Revoking sessions of alice" in output
+
+    quiet = io.StringIO()
+    close = logs.configure(logging.WARNING, quiet, 'buffered')
+    challenge = server.generate_challenge("alice")
+    server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))
+    close()
+    assert quiet.getvalue() == ""
+
+
+def test_sharded_stores_lose_no_updates_under_thread_contention(db_path):
+    sessions, devices = ShardedSessionIndex(shards=4), ShardedDevices(shards=4)
+    server = Server_Srav(db_path, shards=4)
+
+    def worker(t):
+        for i in range(300):
+            user_id = f"user{i % 6}"
+            devices.add(user_id, {'device_id': f"{t}-{i}", 'public_ver_key': i + 2})
+            sessions.add(Session(f"{t}-{i}", user_id, f"device{i % 3}", 0.0, 1.0))
+            if i % 2:
+                assert sessions.pop(f"{t}-{i}").token_id == f"{t}-{i}"
+            if i < 20:
+                server.register_device("shared", i + 2, suppress_output=True)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert sum(len(devices.get(f"user{u}")) for u in range(6)) == 8 * 300
+    assert len(server.get_registered_devices("shared")) == len(server.store.get_devices("shared")) == 8 * 20
+    assert len(sessions) == 8 * 150
+    assert sum(len(sessions.for_user(f"user{u}")) for u in range(6)) == 8 * 150
+    assert sum(len(sessions.pop_device(f"device{d}")) for d in range(3)) == 8 * 150
+    assert len(sessions) == 0 and not any(shard.by_user or shard.by_token for shard in sessions.shards)
+
+
+def test_device_listing_is_cached_until_devices_change_and_honours_etags(db_path):
+    server = Server_Srav(db_path)
+    listings = listing.DeviceListings(server)
+    device_ids = [server.register_device("alice", key, suppress_output=True) for key in (11, 12, 13)]
+
+    etag, body = listings.respond("alice")
+    assert json.loads(body) == {'user_id': "alice", 'devices': device_ids}
+    assert listings.respond("alice", etag) == (etag, None)
+    assert listings.respond("alice", f'"stale", W/{etag}') == (etag, None)
+    assert listings.get("alice") == (etag, body) and listings.stats()['hits'] == 1
+
+    page_etag, page = listings.respond("alice", etag, *listing.parse_page({'offset': '1', 'limit': '1'}))
+    assert page_etag != etag
+    assert json.loads(page) == {'user_id': "alice", 'devices': device_ids[1:2], 'total': 3, 'next_offset': 2}
+    with pytest.raises(ValueError):
+        listing.parse_page({'limit': '0'})
+
+    device_ids.append(server.register_device("alice", 14, suppress_output=True))
+    new_etag, body = listings.respond("alice", etag)
+    assert new_etag != etag and json.loads(body)['devices'] == device_ids
+    server.delete_user("alice")
+    assert json.loads(listings.respond("alice", new_etag)[1])['devices'] == []
+
+
+def test_device_versions_are_bounded_and_never_reused(db_path):
+    Server_Srav(db_path).register_device("bob", 22, suppress_output=True)
+    server = Server_Srav(db_path, lazy=True, cache_size=2)
+    listings = listing.DeviceListings(server)
+    untouched = listings.respond("bob")[0]  # loaded, never changed in this process
+    etags = {untouched}
+    for user_id in ("alice", "carol", "dave"):
+        server.register_device(user_id, 11, suppress_output=True)
+        etags.add(listings.respond(user_id)[0])
+    assert list(server.device_versions) == ["carol", "dave"]
+    assert listings.respond("bob", untouched)[1] is not None
+
+    server.delete_user("dave")
+    assert "dave" not in server.device_versions
+    assert json.loads(listings.respond("dave")[1])['devices'] == []
+    assert listings.respond("alice")[0] not in etags and listings.respond("dave")[0] not in etags
+
+
+def _run_then_crash(db_path, results):
+    # Snapshots after every 4 records, so recovery reads a snapshot and a journal tail.
+    server = Server_Srav(db_path, store=make_store('journal', snapshot_every=4))
+    server.register_device("alice", 11, suppress_output=True)
+    server.register_device("bob", 22, suppress_output=True)
+    _, alice = login(server, "alice", 11)
+    _, bob = login(server, "bob", 22)
+    while server.store.snapshots == 0:
+        time.sleep(0.01)
+    _, bob_again = login(server, "bob", 22)
+    server.revoke_session("bob", bob['token_id'])
+    pending = server.generate_challenge("alice")
+    server.store.flush()
+    results.put((alice, bob, bob_again, pending))
+    results.close()
+    results.join_thread()
+    os._exit(0)  # no close(): nothing is flushed or snapshotted on the way out
+
+
+def test_journal_store_recovers_state_and_pending_challenges_after_a_crash(db_path):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    child = ctx.Process(target=_run_then_crash, args=(db_path, results))
+    child.start()
+    alice, bob, bob_again, pending = results.get(timeout=30)
+    child.join()
+    journals = sorted(name for name in os.listdir(os.path.dirname(db_path)) if '.journal.' in name)
+    assert os.path.exists(db_path + '.snapshot') and len(journals) == 1
+    journal = os.path.join(os.path.dirname(db_path), journals[0])
+    size = os.path.getsize(journal)
+    with open(journal, 'ab') as f:
+        f.write(b'\x00\x00\x00\x40torn')  # a record cut short mid-write
+
+    server = Server_Srav(db_path, store=make_store('journal'))
+    assert os.path.getsize(journal) == size
+    assert len(server.get_registered_devices("alice")) == 1
+    assert server.validate_session("alice", alice)
+    assert not server.validate_session("bob", bob)
+    assert server.validate_session("bob", bob_again)
+    assert server.verify_zkp_proof("alice", pending, pow(pending, 11, server.P))[0]
+    server.close()
+
+    server = Server_Srav(db_path, store=make_store('journal'), lazy=True)
+    assert len(server.challenges) == 0 and len(server.sessions) == 3
+    assert os.path.getsize(server.store._journal_path(server.store.generation)) == 0
+    server.close()
+
+
+def _consume_then_crash(db_path, results):
+    # Signed tokens write nothing to the store, so only the challenge delete
+    # marks the login; it has to be committed before the token is returned.
+    server = Server_Srav(db_path, token_signer=TokenSigner("secret"), store=make_store('journal'))
+    server.register_device("alice", 11, suppress_output=True)
+    challenge = server.generate_challenge("alice")
+    server.store.flush()
+    verified, _ = server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))
+    results.put((verified, challenge))
+    results.close()
+    results.join_thread()
+    os._exit(0)
+
+
+def test_journal_store_never_restores_a_consumed_challenge(db_path):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    child = ctx.Process(target=_consume_then_crash, args=(db_path, results))
+    child.start()
+    verified, challenge = results.get(timeout=30)
+    child.join()
+    assert verified
+
+    server = Server_Srav(db_path, token_signer=TokenSigner("secret"), store=make_store('journal'))
+    with pytest.raises(ValueError, match="No active challenge"):
+        server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))
+    server.close()
+
+
+def test_journal_store_commits_each_login_once(db_path, monkeypatch):
+    server = Server_Srav(db_path, store=make_store('journal'))
+    server.register_device("alice", 11, suppress_output=True)
+    challenge = server.generate_challenge("alice")
+    server.store._stop.set()  # no timed flush in between, only the commits the login waits for
+    server.store._thread.join()
+    server.store.flush()
+    write, commits = server.store._write, []
+    monkeypatch.setattr(server.store, '_write', lambda fd, batch: (commits.append(len(batch)), write(fd, batch)))
+    assert server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))[0]
+    assert commits == [2]  # the challenge delete and the session, together
+    server.close()
+
+
+def test_journal_store_takes_over_an_existing_sqlite_db_once(db_path):
+    server = Server_Srav(db_path, token_signer=TokenSigner("secret"))
+    server.register_device("alice", 11, suppress_output=True)
+    server.register_device("bob", 22, suppress_output=True)
+    _, token = login(server, "alice", 11)
+    _, revoked = login(server, "bob", 22)
+    server.revoke_session("bob", revoked['token_id'])
+    server.close()
+
+    signed = Server_Srav(db_path, token_signer=TokenSigner("secret"), store=make_store('journal'))
+    assert signed.validate_session("alice", token) and not signed.validate_session("bob", revoked)
+    signed.close()
+    server = Server_Srav(db_path, store=make_store('journal'))
+    assert len(server.get_registered_devices("alice")) == 1
+    server.delete_user("bob")
+    server.close()
+    assert "bob" not in Server_Srav(db_path, store=make_store('journal')).user_devices
+
+
+def test_expiry_wheel_removes_abandoned_challenges_and_sessions(db_path):
+    server = Server_Srav(db_path)
+    server.register_device("alice", 11, suppress_output=True)
+    server.register_device("bob", 22, suppress_output=True)
+    login(server, "alice", 11)
+    server.generate_challenge("bob")
+    now = time.time()
+
+    assert server.expire_entries(now) == {'challenges': 0, 'sessions': 0}
+    assert server.expire_entries(now + server.TTL + 2) == {'challenges': 1, 'sessions': 0}
+    assert len(server.challenges) == 0
+
+    # A second login adds a session next to the first; both come due together.
+    login(server, "alice", 11)
+    assert server.expire_entries(now + server.SESSION_EXPIRY + 2) == {'challenges': 0, 'sessions': 2}
+    assert len(Server_Srav(db_path).sessions) == 0
+    assert server.expiry_stats['ticks'] == 3 and len(server.expiry) == 0
+
+
+def test_signed_tokens_validate_without_storage_and_honour_revocation(db_path):
+    server = Server_Srav(db_path, token_signer=TokenSigner("secret"))
+    server.register_device("alice", 11, suppress_output=True)
+    _, token = login(server, "alice", 11)
+
+    assert len(server.sessions) == 0 and server.store.get_user_sessions("alice") == []
+    assert server.validate_session("alice", token)
+    assert server.validate_session("alice", token['signed'])
+    assert not server.validate_session("bob", token)
+    assert not Server_Srav(db_path, token_signer=TokenSigner("other")).validate_session("alice", token)
+    tampered = TokenSigner("other").sign(dict(token, expires_at=token['expires_at'] + 1))
+    assert not server.validate_session("alice", tampered)
+
+    assert server.revoke_session("alice")
+    assert not server.validate_session("alice", token)
+    assert not Server_Srav(db_path, token_signer=TokenSigner("secret")).validate_session("alice", token)
+    _, fresh = login(server, "alice", 11)
+    assert server.validate_session("alice", fresh)
+    assert not server.revoke_session("bob", fresh['token_id'])
+    assert not server.revoke_session("alice", "ab" * 16)
+    assert server.validate_session("alice", fresh)
+    assert server.revoke_session("alice", fresh['token_id'])
+    assert not server.validate_session("alice", fresh)
+
+
+def test_sharded_devices_extend_skips_known_device_ids():
+    devices = ShardedDevices(shards=2)
+    devices.add("alice", {'device_id': "a", 'public_ver_key': 2})
+    assert devices.extend("alice", [{'device_id': d, 'public_ver_key': 3} for d in "abcb"]) == 2
+    assert [d['device_id'] for d in devices["alice"]] == ["a", "b", "c"]
+    assert devices.extend("alice", [{'device_id': "c", 'public_ver_key': 3}]) == 0
+
+
+def test_sharded_devices_bulk_load_groups_rows_by_user():
+    devices = ShardedDevices(shards=4)
+    devices.add("carol", {'device_id': "c", 'public_ver_key': 4})
+    devices.load((f"user{i % 5}", {'device_id': str(i), 'public_ver_key': i + 2}) for i in range(20))
+    assert len(devices) == 6 and [d['device_id'] for d in devices["user3"]] == ["3", "8", "13", "18"]
+    assert devices["carol"] == [{'device_id': "c", 'public_ver_key': 4}]
+
+
+def test_bulk_import_and_export_round_trip(db_path, tmp_path):
+    server = Server_Srav(db_path)
+    server.register_device("alice", 11, suppress_output=True)
+    lines = ['{"user_id": "bob", "public_ver_key": "22"}', '', 'not json',
+             '{"user_id": "carol", "public_ver_key": "0"}', '{"public_ver_key": "5"}',
+             '{"user_id": "bob", "public_ver_key": "33", "device_id": "d2"}']
+    stats = server.import_devices(bulk.read_records(lines), chunk_size=2)
+    assert (stats['imported'], stats['rejected']) == (2, 3)
+    assert [line for line, _ in stats['errors']] == [3, 4, 5]
+    assert server.get_registered_devices("bob")[1] == "d2"
+    assert login(server, "bob", 22)[0]
+
+    export = tmp_path / "devices.csv"
+    assert bulk.main(['export', str(export), '--db', db_path]) == 0
+    other_db = str(tmp_path / "other.db")
+    assert bulk.main(['import', str(export), '--db', other_db, '--chunk-size', '1']) == 0
+    assert bulk.main(['import', str(export), '--db', other_db]) == 0
+    assert sorted(Server_Srav(other_db).store.iter_devices(page_size=1)) == sorted(server.store.iter_devices())
+
+
+def test_metrics_count_outcomes_and_time_hot_paths(db_path):
+    metrics = Metrics()
+    server = Server_Srav(db_path, metrics=metrics)
+    server.register_device("alice", 11, suppress_output=True)
+    _, token = login(server, "alice", 11)
+    challenge = server.generate_challenge("alice")
+    assert server.verify_zkp_proof("alice", challenge, 5) == (False, None)
+    server.challenges[Challenge.id_for(challenge)].issued_at -= server.TTL + 1
+    assert server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P)) == (False, None)
+    with pytest.raises(ValueError):
+        server.verify_zkp_proof("bob", 5, 5)
+    assert server.validate_session("alice", token)
+
+    counters, histograms = metrics.snapshot()
+    assert {labels: n for (name, labels), n in counters.items() if name == 'sdil_verify_total'} == {
+        'outcome="success"': 1, 'outcome="invalid"': 1, 'outcome="expired"': 1, 'outcome="no_devices"': 1}
+    assert histograms[('sdil_verify_match_seconds', 'mode="scan"')][3] == 3
+    assert histograms[('sdil_db_commit_seconds', '')][3] >= 2
+    text = metrics.render()
+    assert 'sdil_challenges_issued_total 2\n' in text
+    assert 'sdil_session_validate_seconds_bucket{le="+Inf"} 1\n' in text
+
+
+def _verify_in_worker(db_path, backend_name, challenge, proof, results):
+    server = Server_Srav(db_path, backend=make_backend(backend_name, shm_capacity=64))
+    try:
+        results.put(server.verify_zkp_proof("alice", challenge, proof))
+    except ValueError:
+        results.put((False, None))
+
+
+@pytest.mark.parametrize("backend_name", ["sqlite", "shm"])
+def test_workers_share_challenges_and_sessions(db_path, backend_name):
+    server = Server_Srav(db_path, backend=make_backend(backend_name, shm_capacity=64))
+    server.register_device("alice", 11, suppress_output=True)
+    challenge = server.generate_challenge("alice")
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_verify_in_worker,
+                           args=(db_path, backend_name, challenge, pow(challenge, 11, server.P), results))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    tokens = [token for verified, token in outcomes if verified]
+    assert len(tokens) == 1
+    assert len(server.challenges) == 0
+    assert server.validate_session("alice", tokens[0])
+
+    other = Server_Srav(db_path, backend=make_backend(backend_name, shm_capacity=64))
+    other.register_device("alice", 22, suppress_output=True)
+    assert len(server.get_registered_devices("alice")) == 2
+    assert other.revoke_session("alice")
+    assert not server.validate_session("alice", tokens[0])
+
+
+@pytest.mark.parametrize("backend_name", ["sqlite", "shm"])
+def test_workers_see_each_others_signed_token_revocations(db_path, backend_name):
+    servers = [Server_Srav(db_path, backend=make_backend(backend_name, shm_capacity=64),
+                           token_signer=TokenSigner("secret")) for _ in range(2)]
+    servers[0].register_device("alice", 11, suppress_output=True)
+    _, token = login(servers[0], "alice", 11)
+    assert servers[1].validate_session("alice", token)
+    assert servers[0].revoke_session("alice", token['token_id'])
+    assert not servers[1].validate_session("alice", token)
+
+
+def test_full_session_table_keeps_the_challenge_and_owners_are_checked_first(db_path):
+    server = Server_Srav(db_path, backend=make_backend("shm", shm_capacity=2))
+    server.register_device("alice", 11, suppress_output=True)
+    server.register_device("bob", 22, suppress_output=True)
+    login(server, "alice", 11)
+    login(server, "bob", 22)
+
+    challenge = server.generate_challenge("alice")
+    with pytest.raises(SharedTableFull):
+        server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))
+    assert server.revoke_session("bob")
+    # bob's devices cannot consume alice's challenge, even past the pre-check.
+    assert server._complete_verification("bob", challenge, "bob's device") == (False, None)
+    assert server.verify_zkp_proof("alice", challenge, pow(challenge, 11, server.P))[0]
+
+
+@pytest.mark.parametrize("backend_name", ["sqlite", "shm"])
+def test_expiry_sweeps_entries_left_by_other_workers(db_path, backend_name):
+    crashed = Server_Srav(db_path, backend=make_backend(backend_name, shm_capacity=64))
+    crashed.register_device("alice", 11, suppress_output=True)
+    login(crashed, "alice", 11)
+    for _ in range(3):
+        crashed.generate_challenge("alice")
+
+    survivor = Server_Srav(db_path, backend=make_backend(backend_name, shm_capacity=64))
+    assert len(survivor.challenges) == 3
+    later = time.time() + 2 * survivor.SESSION_EXPIRY
+    tick = survivor.expire_entries(later)
+    assert tick['challenges'] == 3 and len(survivor.challenges) == 0
+    assert survivor.store.count_sessions() == 0 and len(survivor.sessions) == 0
+    # Sweeps are a full scan, so they run at most once per TTL.
+    crashed.generate_challenge("alice")
+    assert survivor.expire_entries(later + 1)['challenges'] == 0 and len(survivor.challenges) == 1
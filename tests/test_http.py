@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+P = 2**256 - 189
+
+
+@pytest.fixture(scope="module")
+def environment(tmp_path_factory):
+    # config is read once at import, so the environment has to be in place
+    # before either entry point is first imported in this process; it is
+    # restored when the module's tests are done.
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('SDIL_DB_PATH', str(tmp_path_factory.mktemp("http") / "sdi_l.db"))
+        patch.setenv('SDIL_CRYPTO_WORKERS', '0')
+        patch.setenv('SDIL_CHALLENGE_BURST', '3')
+        yield
+
+
+@pytest.fixture(scope="module")
+def client(environment):
+    import app
+    return app.app.test_client()
+
+
+@pytest.fixture(scope="module")
+def asgi(environment):
+    import asgi_app
+    return asgi_app.app
+
+
+def register(client, user_id, key):
+    response = client.post('/register_device', json={'user_id': user_id, 'public_ver_key': str(key)})
+    assert response.status_code == 201
+    return response.get_json()['device_id']
+
+
+def challenge(client, user_id):
+    return int(client.post('/generate_challenge', json={'user_id': user_id}).get_json()['challenge'])
+
+
+def test_batch_verification_reports_each_item(client):
+    register(client, "batch", 11)
+    good, wrong = challenge(client, "batch"), challenge(client, "batch")
+    response = client.post('/verify_proof_batch', json={'items': [
+        {'user_id': "batch", 'challenge': str(good), 'proof': str(pow(good, 11, P))},
+        {'user_id': "batch", 'challenge': str(wrong), 'proof': "12345"},
+        {'user_id': "batch", 'challenge': str(good), 'proof': str(pow(good, 11, P))},
+        {'user_id': "batch"},
+        {'user_id': "batch", 'challenge': [1], 'proof': "2"},
+        1,
+        "x",
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == [200, 401, 400, 400, 400, 400, 400]
+    assert results[0]['verified'] and results[2]['error'] == "No active challenge for batch!"
+    assert client.post('/verify_proof_batch', json=[1]).status_code == 400
+
+
+def test_challenges_past_the_burst_are_rate_limited(client):
+    register(client, "eager", 11)
+    statuses = [client.post('/generate_challenge', json={'user_id': "eager"}).status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+
+
+def test_device_listing_answers_304_until_devices_change(client):
+    first = register(client, "lister", 11)
+    response = client.get('/devices/lister')
+    etag = response.headers['ETag']
+    assert response.get_json()['devices'] == [first]
+    cached = client.get('/devices/lister', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.headers['ETag'] == etag
+
+    second = register(client, "lister", 12)
+    response = client.get('/devices/lister?offset=1&limit=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.get_json()['devices'] == [second]
+    assert client.get('/devices/lister?limit=0').status_code == 400
+
+
+def test_import_devices_streams_ndjson_and_metrics_count_requests(client):
+    body = ('{"user_id": "imported", "public_ver_key": "11"}\n'
+            'not json\n'
+            '{"user_id": "imported", "public_ver_key": "12"}\n')
+    response = client.post('/import_devices', data=body, content_type='application/x-ndjson')
+    stats = response.get_json()
+    assert response.status_code == 200
+    assert (stats['imported'], stats['rejected']) == (2, 1) and stats['errors'][0]['line'] == 2
+    assert len(client.get('/devices/imported').get_json()['devices']) == 2
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'sdil_http_requests_total{route="/import_devices",status="200"} 1' in text
+    assert 'sdil_pending_challenges ' in text
+
+
+async def asgi_request(app, method, path, payload=None, headers=()):
+    path, _, query = path.partition('?')
+    body = json.dumps(payload).encode() if payload is not None else b''
+    requests = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return requests.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+               'headers': list(headers)}, receive, send)
+    start, body = sent
+    return start['status'], dict(start['headers']), body['body']
+
+
+def test_asgi_app_serves_a_login_between_lifespan_startup_and_shutdown(asgi):
+    async def scenario():
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        lifespan = asyncio.create_task(asgi({'type': 'lifespan'}, incoming.get, outgoing.put))
+        await incoming.put({'type': 'lifespan.startup'})
+        assert (await outgoing.get())['type'] == 'lifespan.startup.complete'
+
+        status, _, body = await asgi_request(asgi, 'POST', '/register_device',
+                                             {'user_id': "async", 'public_ver_key': "11"})
+        assert status == 201
+        status, _, body = await asgi_request(asgi, 'POST', '/generate_challenge', {'user_id': "async"})
+        challenge = int(json.loads(body)['challenge'])
+        status, _, body = await asgi_request(asgi, 'POST', '/verify_proof', {
+            'user_id': "async", 'challenge': str(challenge), 'proof': str(pow(challenge, 11, P))})
+        assert status == 200
+        token = json.loads(body)['token']
+        status, _, body = await asgi_request(asgi, 'POST', '/verify_proof', {
+            'user_id': "async", 'challenge': str(challenge), 'proof': str(pow(challenge, 11, P))})
+        assert status == 400 and json.loads(body)['error'] == "No active challenge for async!"
+        status, _, body = await asgi_request(asgi, 'POST', '/validate_session', {'user_id': "async", 'token': token})
+        assert json.loads(body) == {'valid': True}
+
+        fresh, stale = [int(json.loads((await asgi_request(asgi, 'POST', '/generate_challenge',
+                                                           {'user_id': "async"}))[2])['challenge'])
+                        for _ in range(2)]
+        status, _, body = await asgi_request(asgi, 'POST', '/verify_proof_batch', {'items': [
+            {'user_id': "async", 'challenge': str(fresh), 'proof': str(pow(fresh, 11, P))},
+            {'user_id': "async", 'challenge': str(stale), 'proof': "12345"},
+            {'user_id': "async", 'challenge': str(challenge), 'proof': str(pow(challenge, 11, P))},
+            "x",
+        ]})
+        assert status == 200
+        assert [result['status'] for result in json.loads(body)['results']] == [200, 401, 400, 400]
+
+        _, headers, _ = await asgi_request(asgi, 'GET', '/devices/async')
+        status, _, body = await asgi_request(asgi, 'GET', '/devices/async',
+                                             headers=[(b'if-none-match', headers[b'etag'])])
+        assert status == 304 and body == b''
+        status, _, body = await asgi_request(asgi, 'GET', '/metrics')
+        assert b'sdil_verify_seconds_count 2' in body and b'sdil_verify_batch_items_total 2' in body
+        assert b'sdil_pending_challenges 1' in body  # the batch's wrong proof leaves its challenge
+        assert (await asgi_request(asgi, 'POST', '/verify_proof', [1]))[0] == 400
+
+        await incoming.put({'type': 'lifespan.shutdown'})
+        assert (await outgoing.get())['type'] == 'lifespan.shutdown.complete'
+        await lifespan
+    asyncio.run(scenario())